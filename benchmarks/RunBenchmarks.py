@@ -0,0 +1,300 @@
+# RunBenchmarks.py
+#
+# Reproducible performance benchmarks against a local stub embedding server.
+# Usage: python -m benchmarks.RunBenchmarks --sizes 10000,100000 --out results.json
+#        python -m benchmarks.RunBenchmarks --compare before.json after.json
+#
+# Every scenario runs in a fresh process inside a scratch directory, so peak RSS is per
+# scenario and the real data/ and documents/ folders are never touched.
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_MODEL = 'stub-embed'
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _collection_bytes(collection):
+    """Size of a collection's SQLite database (with WAL) and its vector sidecars."""
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join('data', collection + '.*')))
+
+
+def _percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {'p50_ms': float(np.percentile(samples, 50)), 'p95_ms': float(np.percentile(samples, 95)),
+            'p99_ms': float(np.percentile(samples, 99)), 'mean_ms': float(samples.mean())}
+
+
+def _start_stub(args):
+    from src.StubOllamaServer import StubOllamaServer
+
+    return StubOllamaServer(dim=args.dim, latency=args.stub_latency).start()
+
+
+def scenario_ingest(args):
+    """Embedding.embed over a synthetic PDF corpus: throughput, then a no-op incremental re-run."""
+    from benchmarks.SyntheticCorpus import generate_pdf_corpus
+    from src.Embeddings import Embedding
+
+    collection = 'bench_ingest'
+    generate_pdf_corpus(os.path.join('documents', collection), args.pdfs, args.pages, args.seed)
+    stub = _start_stub(args)
+    embedding = Embedding(stub.url, STUB_MODEL, collection, cache_size=0)
+
+    start = time.perf_counter()
+    stored = embedding.embed(collection)
+    seconds = time.perf_counter() - start
+    if stored is None:
+        raise RuntimeError('ingest failed; see the log above')
+    start = time.perf_counter()
+    embedding.embed(collection)
+    noop_seconds = time.perf_counter() - start
+    pages = args.pdfs * args.pages
+    return {
+        'scenario': 'ingest',
+        'files': args.pdfs,
+        'pages': pages,
+        'chunks': len(stored),
+        'seconds': seconds,
+        'chunks_per_s': len(stored) / seconds,
+        'pages_per_s': pages / seconds,
+        'embedding_requests': stub.requests,
+        'reingest_noop_s': noop_seconds,
+        'db_bytes': _collection_bytes(collection),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def scenario_query(args, size):
+    """query_embeddings latency (vector, lexical, hybrid) and raw index search latency at `size` vectors."""
+    from benchmarks.SyntheticCorpus import generate_chunks, synthetic_text
+    from src.Embeddings import Embedding
+
+    collection = f'bench_query_{size}'
+    stub = _start_stub(args)
+    embedding = Embedding(stub.url, STUB_MODEL, collection, cache_size=0, query_cache_size=0)
+
+    start = time.perf_counter()
+    stored = 0
+    for texts, vectors in generate_chunks(size, args.dim, args.seed):
+        source = f'bench/file-{stored // 1000:05d}.pdf'
+        embedding.db.add_chunks(
+            ((text, vector, source, 0, stored + i, f'{source}_{stored + i}')
+             for i, (text, vector) in enumerate(zip(texts, vectors))),
+            batch_size=len(texts)
+        )
+        stored += len(texts)
+    populate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index = embedding.get_index()
+    index_open_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(args.seed + 1)
+    result = {
+        'scenario': f'query_{size}',
+        'vectors': len(index),
+        'dim': args.dim,
+        'top_k': args.top_k,
+        'queries': args.queries,
+        'populate_s': populate_seconds,
+        'index_open_s': index_open_seconds,
+    }
+    for mode in ('vector', 'lexical', 'hybrid'):
+        # Distinct texts, so neither the stub nor any cache sees a repeat
+        queries = [f'{mode} {i} ' + synthetic_text(rng, 8) for i in range(args.queries + args.warmup)]
+        latencies = []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            embedding.query_embeddings(query, args.top_k, mode=mode)
+            if i >= args.warmup:
+                latencies.append(1000.0 * (time.perf_counter() - start))
+        result[mode] = _percentiles(latencies)
+
+    vectors = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    latencies = []
+    for vector in vectors:
+        start = time.perf_counter()
+        index.search(vector, args.top_k)
+        latencies.append(1000.0 * (time.perf_counter() - start))
+    result['index_search'] = _percentiles(latencies)
+    result['db_bytes'] = _collection_bytes(collection)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _import_ms(module, runs):
+    """Median time to import `module` in a fresh interpreter, timed inside that interpreter."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    samples = [1000.0 * float(subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, env=env, check=True,
+                                             capture_output=True, text=True).stdout.split()[-1])
+               for _ in range(runs)]
+    return float(np.median(samples))
+
+
+def scenario_startup(args):
+    """Cold import time of the entry points, and the settings and collection work main() does before the REPL."""
+    from src.Agent import Agent
+    from src.Embeddings import Embedding
+    from src.database.Settings import Settings
+
+    os.makedirs('data', exist_ok=True)
+    result = {'scenario': 'startup'}
+    for module in ('src.Embeddings', 'src.Agent', 'main'):
+        result[f'import_{module.replace(".", "_")}_ms'] = _import_ms(module, args.startup_runs)
+
+    config = {'ollama_url': 'http://localhost:11434', 'collection_name': 'bench_startup',
+              'embedding_model': STUB_MODEL, 'port': 3000, 'sqlite_web_port': 9999, 'flask_host': '0.0.0.0'}
+    settings = Settings()
+    start = time.perf_counter()
+    settings.update(config)
+    result['settings_update_ms'] = 1000.0 * (time.perf_counter() - start)
+    start = time.perf_counter()
+    settings.update(config)
+    result['settings_update_unchanged_ms'] = 1000.0 * (time.perf_counter() - start)
+
+    stub = _start_stub(args)
+    start = time.perf_counter()
+    embedding = Embedding(stub.url, STUB_MODEL, 'bench_startup')
+    Agent(embedding)
+    result['ready_ms'] = 1000.0 * (time.perf_counter() - start)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _run_scenario(name, size, args, workdir):
+    """Entry point of the per-scenario worker process."""
+    os.chdir(workdir)
+    logging.basicConfig(level=logging.WARNING)
+    logging.disable(logging.INFO)
+    if name == 'ingest':
+        return scenario_ingest(args)
+    if name == 'startup':
+        return scenario_startup(args)
+    return scenario_query(args, size)
+
+
+def _environment():
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=REPO_ROOT, capture_output=True, text=True,
+                                   check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='embedding-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    plan = []
+    if 'startup' in args.scenarios:
+        plan.append(('startup', None))
+    if 'ingest' in args.scenarios:
+        plan.append(('ingest', None))
+    if 'query' in args.scenarios:
+        plan.extend(('query', size) for size in args.sizes)
+
+    report = {'environment': _environment(), 'arguments': vars(args), 'results': []}
+    try:
+        for name, size in plan:
+            label = name if size is None else f'{name} @ {size} vectors'
+            print(f"Running {label} ...", file=sys.stderr)
+            # A fresh process per scenario keeps peak RSS and warm caches from leaking between them
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(_run_scenario, name, size, args, workdir).result()
+            report['results'].append(result)
+            print(json.dumps(result), file=sys.stderr)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+def _flatten(result, prefix=''):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def compare(base_path, head_path):
+    """Print the relative change of every numeric metric between two result files."""
+    with open(base_path) as file:
+        base = {result['scenario']: dict(_flatten(result)) for result in json.load(file)['results']}
+    with open(head_path) as file:
+        head = {result['scenario']: dict(_flatten(result)) for result in json.load(file)['results']}
+    for scenario in head:
+        if scenario not in base:
+            continue
+        print(scenario)
+        for metric, value in head[scenario].items():
+            before = base[scenario].get(metric)
+            if before is None:
+                continue
+            change = f'{100.0 * (value - before) / before:+.1f}%' if before else 'n/a'
+            print(f'  {metric:<28} {before:>14.3f} -> {value:>14.3f}  {change}')
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, REPO_ROOT)
+    parser = argparse.ArgumentParser(description='Ingest and query benchmarks against a stub embedding server.')
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=['startup', 'ingest', 'query'],
+                        help='comma-separated subset of: startup, ingest, query')
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=[10000, 100000, 1000000], help='collection sizes for the query scenario')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension')
+    parser.add_argument('--queries', type=int, default=200, help='timed queries per mode')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed queries per mode')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--pdfs', type=int, default=20, help='PDFs in the ingest corpus')
+    parser.add_argument('--pages', type=int, default=10, help='pages per PDF')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='seconds the stub sleeps per request')
+    parser.add_argument('--startup-runs', type=int, default=5, help='fresh interpreters per import timing')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='scratch directory (default: a temporary one, removed afterwards)')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary scratch directory')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two JSON reports')
+    arguments = parser.parse_args()
+    if arguments.compare:
+        compare(*arguments.compare)
+    else:
+        run(arguments)
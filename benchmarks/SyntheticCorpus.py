@@ -0,0 +1,111 @@
+# SyntheticCorpus.py
+#
+# Deterministic synthetic corpora for the benchmarks: PDFs for ingest, and chunk texts with
+# clustered vectors for populating large collections directly.
+# Usage: python -m benchmarks.SyntheticCorpus documents/synthetic --files 20 --pages 10
+
+import argparse
+import os
+
+import numpy as np
+
+WORDS = (
+    'account balance invoice payment statement transfer deposit interest branch customer '
+    'language automaton grammar machine state proof theorem lemma decidable regular '
+    'context free turing reduction complexity polynomial time space class problem '
+    'the of and to in is for on with as by at from that this which be are was it an '
+    'total amount due date period charge fee rate credit debit reference number terms'
+).split()
+
+LINES_PER_PAGE = 48
+WORDS_PER_LINE = 12
+
+
+def synthetic_text(rng, n_words):
+    """Pseudo-English text, with an occasional invoice-style identifier for lexical search."""
+    words = [WORDS[i] for i in rng.integers(0, len(WORDS), n_words)]
+    for position in rng.integers(0, n_words, max(1, n_words // 200)):
+        words[position] = f"TLBINV{rng.integers(10 ** 9, 10 ** 10)}"
+    return ' '.join(words)
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF; `pages` is a list of pages, each a list of text lines."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    # WinAnsiEncoding lets PyPDF2 map glyphs back to text word by word
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    pages_id = add(None)
+    kids = []
+    for lines in pages:
+        operations = ['BT /F1 10 Tf 14 TL 50 780 Td'] + [f'({_escape(line)}) Tj T*' for line in lines] + ['ET']
+        stream = '\n'.join(operations).encode('latin-1')
+        contents = add(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        kids.append(add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] '
+                        b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' % (pages_id, font, contents)))
+    objects[pages_id - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+    catalog = add(b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+    with open(path, 'wb') as file:
+        file.write(out)
+
+
+def generate_pdf_corpus(folder, files: int = 20, pages: int = 10, seed: int = 0):
+    """Write `files` PDFs of `pages` pages each into folder; returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for number in range(files):
+        document = []
+        for _ in range(pages):
+            text = synthetic_text(rng, LINES_PER_PAGE * WORDS_PER_LINE).split(' ')
+            document.append([' '.join(text[i:i + WORDS_PER_LINE]) for i in range(0, len(text), WORDS_PER_LINE)])
+        path = os.path.join(folder, f'synthetic-{number:04d}.pdf')
+        write_pdf(path, document)
+        paths.append(path)
+    return paths
+
+
+def generate_chunks(n, dim, seed: int = 0, batch_size: int = 10000, clusters: int = 256, words: int = 80):
+    """
+    Yield batches of (texts, vectors) for n chunks.
+
+    Vectors are drawn around `clusters` random centres so approximate indexes see realistic
+    structure; the same seed always gives the same corpus.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        vectors = centres[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+        yield [synthetic_text(rng, words) for _ in range(size)], vectors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a deterministic synthetic PDF corpus.')
+    parser.add_argument('folder')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    written = generate_pdf_corpus(args.folder, args.files, args.pages, args.seed)
+    print(f"Wrote {len(written)} PDFs to {args.folder}")
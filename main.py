@@ -3,10 +3,13 @@
 import json
 import os
 import logging
+import time
 from datetime import datetime
 
 from src.Agent import Agent
 from src.Embeddings import Embedding
+from src.IngestWorker import IngestWorker
+from src.Metrics import metrics, profile_call
 from src.database.Settings import Settings
 
 
@@ -29,15 +32,16 @@ def load_and_validate_json(file_path):
 
 
 def update_settings_from_json(settings, json_data):
+    """Apply settings.json to the settings database; returns False when nothing changed."""
     try:
-        # Extract configuration and update settings
+        # Extract configuration and update settings in one transaction
         config = json_data.get('config', {})
-        settings.set('ollama_url', config.get('ollama_url'))
-        settings.set('collection_name', config.get('collection_name'))
-        settings.set('embedding_model', config.get('embedding_model'))
-        settings.set('port', config.get('port'))
-        settings.set('sqlite_web_port', config.get('sqlite_web_port'))
-        settings.set('flask_host', config.get('flask_host'))
+        changed = settings.update({key: config.get(key) for key in (
+            'ollama_url', 'collection_name', 'embedding_model', 'port', 'sqlite_web_port', 'flask_host')})
+        if not changed:
+            # Leave settings.json (and its updateAt) alone when it brought nothing new
+            logging.info("Settings are unchanged; settings.json not rewritten.")
+            return False
 
         # Update 'valid' to false and set 'updateAt' with the current timestamp
         json_data['valid'] = False
@@ -52,13 +56,28 @@ def update_settings_from_json(settings, json_data):
             json.dump(json_data, file, indent=4)
 
         logging.info("settings.json updated successfully.")
+        return True
 
     except Exception as e:
         logging.error(f"Error updating settings.json: {e}")
         raise
 
 
+def print_ingest_status(status):
+    current = status['current']
+    if current:
+        print(f"Ingesting {current['path']} (job {current['id']}): {current['chunks_done']} chunks stored so far.")
+    else:
+        print("No ingest in progress.")
+    for job in status['jobs']:
+        line = f"  job {job['id']} {job['path']}: {job['status']}, {job['chunks_done']} chunks"
+        if job['error']:
+            line += f" ({job['error']})"
+        print(line)
+
+
 def main():
+    start = time.perf_counter()
     # Set up logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -75,8 +94,8 @@ def main():
 
     if json_data:
         # Update settings using the JSON data
-        update_settings_from_json(settings, json_data)
-        logging.info("Settings updated successfully.")
+        if update_settings_from_json(settings, json_data):
+            logging.info("Settings updated successfully.")
     else:
         logging.error("Failed to update settings due to invalid JSON data.")
 
@@ -89,19 +108,37 @@ def main():
     # Initialize Embedding with settings
     emb = Embedding(ollama_url, embedding_model, collection_name)
 
-    # Embed documents
-    emb.embed("books", int(settings.get('chunk_size', '500')))
+    # Embed documents in the background; chunks become searchable batch by batch
+    worker = IngestWorker(emb).start()
+    worker.enqueue("books", int(settings.get('chunk_size', '500')))
     # Initialize Agent with the Embedding instance
     agent = Agent(emb, ollama_url, model)
+    metrics.observe('startup_seconds', time.perf_counter() - start)
+    logging.info(f"Ready for queries {1000.0 * (time.perf_counter() - start):.0f} ms after start.")
 
     # Use the Agent to process input
-    while True:
-        print("Enter 'exit' to quit.")
-        query = input("Enter a query: ")
-        if query == 'exit':
-            break
-        response = agent.input(query)
-        print(response)
+    try:
+        while True:
+            print("Enter 'exit' to quit, ':status' for ingest progress, or ':profile <query>' to profile one answer.")
+            query = input("Enter a query: ")
+            if query == 'exit':
+                break
+            if query == ':status':
+                print_ingest_status(worker.status())
+                continue
+            if query.startswith(':profile '):
+                # Answer one question under cProfile and print where the time went
+                response, report = profile_call(agent.input, query[len(':profile '):])
+                print(response)
+                print(report)
+                continue
+            # Print tokens as they arrive rather than after the whole completion
+            for token in agent.stream(query):
+                print(token, end='', flush=True)
+            print()
+    finally:
+        # Finish the batch in flight; an unfinished ingest resumes on the next start
+        worker.stop()
 
 
 if __name__ == '__main__':
@@ -2,59 +2,196 @@
 
 import os
 import logging
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain_openai import OpenAI
+import threading
+import time
+from src.database.AnswerCache import AnswerCache
+from src.Metrics import metrics
 
 
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
 
 class Agent:
     def __init__(self, embedding, ollama_url=None, model_name: str = "llama3.1-8b",
-                 system_prompt: str = "You are a helpful assistant."):
+                 system_prompt: str = "You are a helpful assistant.", answer_cache_threshold: float = 0.95,
+                 answer_cache_size: int = 1000, answer_cache_ttl: float = 86400.0, top_k: int = 5,
+                 context_token_budget: int = 1500, token_counter=estimate_tokens):
         self.embedding = embedding
         self.ollama_url = ollama_url
         self.model = model_name
         self.system_prompt = system_prompt
         self.logger = logging.getLogger(__name__)
         self.openai_key = os.environ.get('OpenAIKey')
-        self.llm = OpenAI(api_key=self.openai_key, model="text-davinci-003")
-        self.prompt_template = PromptTemplate.from_template("""
+        self.prompt = """
         {system_prompt}
 
+        Answer using the following context.
+
+        {context}
+
         User: {input}
-        """)
+        """
+        # Retrieved chunks are packed into at most `context_token_budget` tokens of context
+        self.top_k = top_k
+        self.context_token_budget = context_token_budget
+        self.token_counter = token_counter
+        # Near-duplicate questions reuse an earlier answer; answer_cache_size=0 disables it
+        self.answer_cache = AnswerCache(embedding.db.collection, embedding.emb_model, answer_cache_threshold,
+                                        answer_cache_size, answer_cache_ttl) if answer_cache_size else None
+        self._llm = None
+        self._llm_chain = None
+        self._chain_lock = threading.Lock()
+        self.last_timings = {}
+
+    @property
+    def llm_chain(self):
+        """
+        The prompt | LLM chain, built on first use.
+
+        Built once, so the LLM client and its pooled HTTP connections are reused across
+        queries; deferring it keeps langchain out of startup and off answer-cache hits.
+        """
+        if self._llm_chain is None:
+            with self._chain_lock:
+                if self._llm_chain is None:
+                    from langchain.prompts import PromptTemplate
+                    from langchain_openai import OpenAI
+
+                    self._llm = OpenAI(api_key=self.openai_key, model="text-davinci-003")
+                    self._llm_chain = PromptTemplate.from_template(self.prompt) | self._llm
+        return self._llm_chain
 
     def input(self, prompt_text):
+        """Answer a prompt and return the full response."""
+        return ''.join(self.stream(prompt_text))
+
+    def stream(self, prompt_text):
+        """Answer a prompt, yielding response tokens as the LLM generates them."""
         try:
+            start = time.perf_counter()
+            self.last_timings = {}
+            query_vector = None
+            if self.answer_cache is not None:
+                # The query embedding is cached, so retrieval below does not embed it again
+                query_vector = self.embedding.embed_queries([prompt_text])[0]
+
             # Retrieve vector data using the embedding instance
-            vector_data = self.embedding.query_embeddings(prompt_text)
-            self.logger.info(f"Vector data retrieved for prompt: {prompt_text}")
+            vector_data = self.embedding.query_embeddings(prompt_text, self.top_k)
+            retrieved = [uuid for uuid, _ in vector_data]
+            if self.answer_cache is not None:
+                # A cached answer only counts while retrieval still returns the same set of chunks,
+                # so chunks ingested or deleted since it was written invalidate it. A reworded
+                # question may rank them in another order.
+                response = self.answer_cache.lookup(query_vector,
+                                                    lambda chunk_ids: set(chunk_ids) == set(retrieved))
+                metrics.increment('answer_cache_lookups_total', hit=response is not None)
+                if response is not None:
+                    self.last_timings['first_token_ms'] = 1000.0 * (time.perf_counter() - start)
+                    yield response
+                    return
+
+            context = self._build_context(vector_data)
+            self.last_timings['retrieval_ms'] = 1000.0 * (time.perf_counter() - start)
+            metrics.observe('agent_retrieval_seconds', self.last_timings['retrieval_ms'] / 1000.0)
+            self.logger.debug("Vector data retrieved for prompt: %s", prompt_text)
 
             # Make AI chain chat request using LangChain
-            response = self._make_ai_chain_chat_request(vector_data)
-            self.logger.info(f"AI chain chat response: {response}")
+            tokens = []
+            llm_start = time.perf_counter()
+            for token in self._make_ai_chain_chat_request(prompt_text, context):
+                if not tokens:
+                    self.last_timings['first_token_ms'] = 1000.0 * (time.perf_counter() - start)
+                    metrics.observe('llm_first_token_seconds', time.perf_counter() - llm_start)
+                    self.logger.info(f"Time to first token: {self.last_timings['first_token_ms']:.0f} ms.")
+                tokens.append(token)
+                yield token
+            response = ''.join(tokens)
+            self.last_timings['total_ms'] = 1000.0 * (time.perf_counter() - start)
+            metrics.observe('llm_call_seconds', time.perf_counter() - llm_start)
+            metrics.observe_size('llm_response_tokens', len(tokens))
+            self.logger.info(f"AI chain chat response in {self.last_timings['total_ms']:.0f} ms.")
+            self.logger.debug("AI chain chat response: %s", response)
 
-            return response
+            # An answer without context (e.g. asked while the collection is still ingesting) is not cached
+            if self.answer_cache is not None and context:
+                self.answer_cache.store(prompt_text, query_vector, retrieved, response)
         except Exception as e:
             self.logger.error(f"Error processing input: {e}")
             raise
 
-    def _make_ai_chain_chat_request(self, vector_data):
-        try:
-            self.logger.info(f"Using {self.llm.__class__.__name__} for AI chain chat request.")
+    def _build_context(self, vector_data):
+        """
+        Fetch the matched chunks in one read and pack them, best first, into the token budget.
+
+        Chunks whose text repeats one already packed are dropped, and text overlapping the
+        end of a neighbouring chunk from the same source is only included once.
+        """
+        chunks = self.embedding.db.get_chunks([uuid for uuid, _ in vector_data])
+        packed = []
+        seen = set()
+        budget = self.context_token_budget
+        for uuid, _ in vector_data:
+            if uuid not in chunks:
+                continue
+            source, page, chunk_index, text = chunks[uuid]
+            normalized = ' '.join(text.split())
+            if not normalized or normalized in seen or any(normalized in other for other in seen):
+                continue
+            for other_source, _, other_index, other_text in packed:
+                if other_source != source or chunk_index is None or other_index is None:
+                    continue
+                if other_index == chunk_index - 1:
+                    text = text[self._overlap(other_text, text):]
+                elif other_index == chunk_index + 1:
+                    text = text[:len(text) - self._overlap(text, other_text)]
+            tokens = self.token_counter(text)
+            if tokens > budget:
+                if budget < 32:
+                    break
+                # Keep the head of the last chunk that does not fit completely
+                text = self._truncate(text, budget)
+                tokens = self.token_counter(text)
+            seen.add(normalized)
+            packed.append((source, page, chunk_index, text))
+            budget -= tokens
+            if budget <= 0:
+                break
+        self.logger.debug("Packed %d of %d chunks into %d/%d context tokens.", len(packed), len(vector_data),
+                          self.context_token_budget - budget, self.context_token_budget)
+        return '\n\n'.join(f"[{source}, page {page}]\n{text}" for source, page, _, text in packed)
 
-            # Create the LLMChain
-            llm_chain = LLMChain(
-                llm=self.llm,
-                prompt=self.prompt_template
-            )
+    def _truncate(self, text, budget):
+        """Longest prefix of `text` that `token_counter` counts as at most `budget` tokens."""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    @staticmethod
+    def _overlap(previous, text, min_overlap: int = 16, max_overlap: int = 500):
+        """Length of the longest suffix of `previous` that `text` starts with (0 below `min_overlap`)."""
+        for size in range(min(len(previous), len(text), max_overlap), min_overlap - 1, -1):
+            if previous.endswith(text[:size]):
+                return size
+        return 0
+
+    def _make_ai_chain_chat_request(self, prompt_text, context):
+        try:
+            llm_chain = self.llm_chain
+            self.logger.debug("Using %s for AI chain chat request.", self._llm.__class__.__name__)
 
-            # Run the LLMChain with the vector data and system prompt
-            response = llm_chain.run({
+            # Stream the completion for the prompt, retrieved context and system prompt
+            yield from llm_chain.stream({
                 "system_prompt": self.system_prompt,
-                "input": vector_data
+                "context": context,
+                "input": prompt_text
             })
-            return response
         except Exception as e:
             self.logger.error(f"Error during AI chain chat request: {e}")
             raise
@@ -0,0 +1,96 @@
+# BatchQuery.py
+#
+# Offline batch retrieval: answers a JSONL file of queries with Embedding.query_batch.
+# Usage: python -m src.BatchQuery queries.jsonl --out results.jsonl [--top-k 5] [--stub]
+#        python -m src.BatchQuery requests.jsonl --field title,body --id-field request_id
+#
+# Each input line is a JSON object (or a bare JSON string). The query text is the named
+# field(s), joined by a blank line. Each output line is
+#   {"id": ..., "query": "...", "results": [{"uuid", "score", "source", "page", "text"}]}
+# in input order. Queries are embedded and searched in batches of --batch-size.
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+
+def read_queries(file, fields=('query',), id_field: str = 'id'):
+    """Yield (id, text) for every non-empty line; the id defaults to the 1-based line number."""
+    for number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            yield number, record
+            continue
+        text = '\n\n'.join(str(record[field]) for field in fields if record.get(field))
+        yield record.get(id_field, number), text
+
+
+def run_batch(embedding, queries, out, top_k: int = 5, batch_size: int = 256, with_text: bool = True):
+    """Answer [(id, text)] in batches and write one JSON line per query to `out`; returns the count."""
+    written = 0
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        matches = embedding.query_batch([text for _, text in batch], top_k, batch_size)
+        chunks = embedding.db.get_chunks([uuid for result in matches for uuid, _ in result])
+        for (query_id, text), result in zip(batch, matches):
+            rows = []
+            for uuid, score in result:
+                row = {'uuid': uuid, 'score': score}
+                if uuid in chunks:
+                    source, page, _, chunk_text = chunks[uuid]
+                    row.update(source=source, page=page)
+                    if with_text:
+                        row['text'] = chunk_text
+                rows.append(row)
+            out.write(json.dumps({'id': query_id, 'query': text, 'results': rows}) + '\n')
+            written += 1
+    return written
+
+
+if __name__ == '__main__':
+    from src.database.Settings import Settings
+    from src.Embeddings import Embedding
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description='Answer a JSONL file of queries with batched vector search.')
+    parser.add_argument('input', help="JSONL file of queries ('-' for stdin)")
+    parser.add_argument('--out', help='JSONL file for the results (default: stdout)')
+    parser.add_argument('--collection', default=settings.get('collection_name'))
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=256, help='queries embedded and searched together')
+    parser.add_argument('--field', default='query', help='comma-separated fields joined into the query text')
+    parser.add_argument('--id-field', default='id', help='field copied to the output id (default: line number)')
+    parser.add_argument('--no-text', action='store_true', help='omit chunk text from the results')
+    parser.add_argument('--stub', action='store_true',
+                        help='embed with an in-process stub Ollama server instead of the configured one')
+    parser.add_argument('--stub-dim', type=int, default=1024, help='dimension of the stub embeddings')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    ollama_url = settings.get('ollama_url')
+    embedding_model = settings.get('embedding_model')
+    if args.stub:
+        from src.StubOllamaServer import StubOllamaServer
+
+        stub = StubOllamaServer(dim=args.stub_dim).start()
+        ollama_url, embedding_model = stub.url, 'stub-embed'
+        logging.info(f"Using the stub embedding backend at {stub.url}")
+    embedding = Embedding(ollama_url, embedding_model, args.collection, cache_size=0 if args.stub else 100000)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    with source:
+        queries = list(read_queries(source, args.field.split(','), args.id_field))
+    start = time.perf_counter()
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        count = run_batch(embedding, queries, out, args.top_k, args.batch_size, not args.no_text)
+    finally:
+        if args.out:
+            out.close()
+    seconds = time.perf_counter() - start
+    logging.info(f"Answered {count} queries in {seconds:.2f} s ({count / max(seconds, 1e-9):.0f} queries/s).")
@@ -0,0 +1,111 @@
+import http.client
+import json
+import logging
+import queue
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from src.Metrics import metrics
+
+
+class EmbeddingRequestError(Exception):
+    def __init__(self, message, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class OllamaEmbeddingClient:
+    """
+    Batched, concurrent client for Ollama's /api/embeddings endpoint.
+
+    Texts are split into batches of `batch_size`; up to `max_concurrency` batches run at once,
+    each sending its texts over a pooled keep-alive HTTP connection. A failed request is
+    retried with exponential backoff and jitter without aborting the other batches.
+
+    /api/embeddings takes one prompt per request, but it returns the raw model vectors that
+    every stored collection was built from. The batched /api/embed endpoint unit-normalizes
+    its output, which would put new vectors on a different scale from the stored ones.
+    """
+
+    RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str, model: str, batch_size: int = 32, max_concurrency: int = 4,
+                 max_retries: int = 4, backoff: float = 0.5, timeout: float = 120.0):
+        self.logger = logging.getLogger(__name__)
+        url = urlsplit(base_url or 'http://localhost:11434')
+        self.scheme = url.scheme or 'http'
+        self.host = url.hostname or 'localhost'
+        self.port = url.port
+        self.base_path = url.path.rstrip('/')
+        self.model = model
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._connections = queue.LifoQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='ollama-embed')
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _post(self, path, payload):
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            connection.request('POST', self.base_path + path, body=body,
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Drop the broken connection; the retry opens a fresh one
+            connection.close()
+            raise EmbeddingRequestError(f"Connection to {self.host} failed: {e}")
+        self._connections.put(connection)
+        if response.status != 200:
+            raise EmbeddingRequestError(f"HTTP {response.status} from {path}: {data[:200]!r}",
+                                        retryable=response.status in self.RETRYABLE_STATUS)
+        return json.loads(data)
+
+    def _embed_text(self, text):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer('embed_request_seconds'):
+                    return self._post('/api/embeddings', {'model': self.model, 'prompt': text})['embedding']
+            except EmbeddingRequestError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    metrics.increment('embed_request_failures_total')
+                    raise
+                metrics.increment('embed_request_retries_total')
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                self.logger.warning(f"Embedding request failed ({e}); retrying in {delay:.2f}s.")
+                time.sleep(delay)
+
+    def _embed_batch(self, texts):
+        return [self._embed_text(text) for text in texts]
+
+    def embed_documents(self, texts):
+        """Embed texts in order, running the batches concurrently."""
+        texts = list(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        embeddings = []
+        for batch_embeddings in self._executor.map(self._embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
@@ -1,17 +1,35 @@
+import hashlib
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
 import numpy as np
 
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
-from langchain_openai import OpenAI
-from langchain_community.embeddings import OllamaEmbeddings
 from src.database.Database import Database
+from src.database.VectorStore import VectorStore
+from src.database.EmbeddingCache import EmbeddingCache
+from src.VectorIndex import VectorIndex
+from src.IvfIndex import IvfIndex
+from src.QuantizedIndex import QuantizedIndex
+from src.Pipeline import batched, prefetch
+from src.PdfExtractor import iter_pages
+from src.EmbeddingClient import OllamaEmbeddingClient
+from src.LruCache import LruCache
+from src.Metrics import metrics
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
 
 
 class Embedding:
-    def __init__(self, ollama_url: str, embedding_ollama_model: str, database_name: str):
+    def __init__(self, ollama_url: str, embedding_ollama_model: str, database_name: str, metric: str = 'l2',
+                 index_type: str = None, db_batch_size: int = 500, embed_batch_size: int = 32,
+                 max_in_flight: int = 4, extract_workers: int = None, pages_per_task: int = 16,
+                 embed_concurrency: int = 4, embed_retries: int = 4, cache_size: int = 100000,
+                 query_cache_size: int = 1024, query_cache_ttl: float = 3600.0, compact_threshold: float = 0.2):
         # Set up logging
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
@@ -19,91 +37,339 @@ class Embedding:
         self.ollama_base_url = ollama_url
         self.emb_model = embedding_ollama_model
         self.db = Database(database_name)
+        self.metric = metric
+        self.db_batch_size = db_batch_size
+        self.embed_batch_size = embed_batch_size
+        self.client = OllamaEmbeddingClient(ollama_url, embedding_ollama_model, batch_size=embed_batch_size,
+                                            max_concurrency=embed_concurrency, max_retries=embed_retries)
+        # Identical chunks (headers, boilerplate, repeated invoices) are embedded once; 0 disables the cache
+        self.cache = EmbeddingCache(embedding_ollama_model, cache_size) if cache_size else None
+        # Repeated and popular queries skip the embedding round-trip entirely
+        self.query_cache = LruCache(query_cache_size, query_cache_ttl)
+        self.max_in_flight = max_in_flight
+        # PDF text extraction runs in a process pool (defaults to one worker per CPU)
+        self.extract_workers = extract_workers
+        self.pages_per_task = pages_per_task
+        # 'flat' (exact) or 'ivf' (approximate); defaults to the choice stored with the collection
+        self.index_type = index_type or self.db.get_meta('index_type', 'flat')
+        # Optional first-pass scan over float16/int8 codes for the flat index ('none' to disable)
+        self.quantization = self.db.get_meta('quantization', 'none')
+        self.index = None
+        # Guards the index while a background ingest appends to it and queries search it
+        self.index_lock = threading.RLock()
+        # Hybrid queries run the lexical and the vector retriever side by side
+        self._search_pool = None
+        # Once this fraction of the index rows is tombstoned, a background job compacts the collection
+        self.compact_threshold = compact_threshold
+        self._compaction_pool = None
+        self._compaction = None
+        # One compaction at a time: they share the <collection>.compact.* scratch files
+        self._compact_lock = threading.Lock()
+        self.last_timings = {}
 
     def embed(self, document_path, chunk_size: int = 500):
+        """Ingest documents/<document_path> (see `ingest`); returns the stored chunk UUIDs, or None on error."""
         try:
-            self.logger.info(f"Starting the embedding process for document at {document_path}.")
-            chunks = self.__document_loader(document_path, chunk_size)
-            embeddings = self.__emb_invoke(chunks)
-            result = self.__load_to_db(chunks, embeddings)
-            self.logger.info(f"Embedding process completed successfully for document at {document_path}.")
-            return result
+            return self.ingest(document_path, chunk_size)
         except Exception as e:
             self.logger.error(f"Error during embedding process: {e}")
             return None
 
-    def __document_loader(self, custom_path, chunk_size):
+    def ingest(self, document_path, chunk_size: int = 500, should_stop=None, on_batch=None):
+        """
+        Stream documents page -> chunk -> embedding batch -> DB batch.
+
+        The folder is first reconciled with the file manifest: only added or changed files are
+        embedded, and the chunks of changed or deleted files are removed from the database and
+        the index. Each stage runs ahead of the next by at most `max_in_flight` batches, so
+        memory stays bounded regardless of folder size. Progress is checkpointed with every DB
+        batch and an interrupted run resumes after the last committed chunk; each batch is
+        searchable as soon as it commits.
+
+        `should_stop()` is checked before every DB batch and ends the run early; `on_batch(n)`
+        is called with the number of chunks stored so far. Errors are raised.
+        """
+        self.logger.info(f"Starting the embedding process for document at {document_path}.")
+        start = time.perf_counter()
+        with metrics.timer('ingest_load_seconds'):
+            pdf_paths = self.__sync_manifest(document_path)
+        # Read checkpoints up front: the loader runs on a pipeline thread
+        chunks = self.__document_loader(document_path, chunk_size, self.db.get_progress(), pdf_paths)
+        # Hand the client enough chunks per call to keep all of its concurrent requests busy
+        chunk_batches = prefetch(batched(chunks, self.embed_batch_size * self.client.max_concurrency),
+                                 self.max_in_flight)
+        embedded = prefetch(self.__embed_batches(chunk_batches), self.max_in_flight)
+        result = []
         try:
-            self.logger.info(f"Loading document from path: {custom_path}.")
-            directory_path = os.path.abspath(os.path.join('documents', custom_path))
-
-            if not os.path.isdir(directory_path):
-                raise FileNotFoundError(f"The directory at {directory_path} does not exist.")
-
-            all_splits = []
-            document_id = str(custom_path)  # Use custom path as document ID
-
-            for filename in os.listdir(directory_path):
-                if filename.endswith('.pdf'):
-                    pdf_path = os.path.join(directory_path, filename)
-                    read_marker_path = pdf_path + '.read'
-
-                    if os.path.exists(read_marker_path):
-                        self.logger.info(f"Skipping already processed file: {filename}")
-                        continue
-
-                    texts = ""
-                    try:
-                        with open(pdf_path, 'rb') as file:
-                            reader = PdfReader(file)
-                            for page in reader.pages:
-                                texts += page.extract_text()
-                    except Exception as e:
-                        self.logger.error(f"Error reading PDF file {pdf_path}: {e}")
-                        continue
-
-                    document = Document(page_content=texts)
-                    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
-                    splits = text_splitter.split_documents([document])
-
-                    # Create CustomDocument objects with chunk IDs
-                    for i, split in enumerate(splits):
-                        chunk_id = f"{document_id}_{i}"
-                        all_splits.append(CustomDocument(split, chunk_id))
-
-                    # Create a .read file to mark this PDF as processed
-                    with open(read_marker_path, 'w') as marker_file:
-                        marker_file.write('')
-
-            self.logger.info(f"Document loaded and split into {len(all_splits)} chunks.")
-            return all_splits
-        except FileNotFoundError as e:
-            self.logger.error(f"File not found: {e}")
-            raise
+            for db_batch in batched(embedded, self.db_batch_size):
+                if should_stop is not None and should_stop():
+                    self.logger.info(f"Ingest of {document_path} stopped after {len(result)} chunks; "
+                                     f"it resumes from the checkpoint next time.")
+                    return result
+                batch_chunks, batch_embeddings = zip(*db_batch)
+                result.extend(self.__load_to_db(batch_chunks, batch_embeddings))
+                if on_batch is not None:
+                    on_batch(len(result))
+        finally:
+            # Stops the extraction and embedding threads if the run ends early
+            embedded.close()
+            chunk_batches.close()
+        metrics.observe('ingest_seconds', time.perf_counter() - start)
+        self.logger.info(f"Embedding process completed successfully for document at {document_path}: "
+                         f"{len(result)} chunks stored.")
+        return result
+
+    @staticmethod
+    def __file_sha256(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def __sync_manifest(self, custom_path):
+        """
+        Compare documents/<custom_path> with the file manifest and return the PDFs to ingest.
+
+        Unchanged files (same size and mtime, or same content hash) are skipped. Chunks of
+        changed and deleted files are removed from the database and tombstoned in the index.
+        """
+        directory_path = os.path.abspath(os.path.join('documents', custom_path))
+        if not os.path.isdir(directory_path):
+            self.logger.error(f"File not found: The directory at {directory_path} does not exist.")
+            raise FileNotFoundError(f"The directory at {directory_path} does not exist.")
+
+        document_id = str(custom_path)  # Use custom path as document ID
+        manifest = self.db.get_files(f"{document_id}/")
+        pdf_paths = []
+        seen = set()
+        for filename in sorted(os.listdir(directory_path)):
+            if not filename.endswith('.pdf'):
+                continue
+            pdf_path = os.path.join(directory_path, filename)
+            source = f"{document_id}/{filename}"
+            seen.add(source)
+            stat = os.stat(pdf_path)
+            entry = manifest.get(source)
+            if entry and entry[3] == 'done' and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+                continue
+
+            sha256 = self.__file_sha256(pdf_path)
+            if entry is None and os.path.exists(pdf_path + '.read'):
+                # Ingested before the manifest existed; adopt it rather than embedding it twice
+                self.logger.info(f"Adopting previously processed file into the manifest: {filename}")
+                self.db.upsert_file(source, stat.st_size, stat.st_mtime, sha256, 'done')
+                continue
+            if entry and entry[2] == sha256:
+                # Same content: either only the mtime moved, or an interrupted ingest to resume
+                self.db.upsert_file(source, stat.st_size, stat.st_mtime, sha256, entry[3])
+                if entry[3] == 'done':
+                    continue
+            elif entry:
+                self.logger.info(f"{filename} changed; replacing its chunks.")
+                self.__remove_source(source, keep_file=True)
+            else:
+                self.logger.info(f"New file: {filename}")
+            self.db.upsert_file(source, stat.st_size, stat.st_mtime, sha256, 'ingesting')
+            pdf_paths.append(pdf_path)
+
+        for source in manifest.keys() - seen:
+            self.logger.info(f"{source} was deleted; removing its chunks.")
+            self.__remove_source(source)
+        return pdf_paths
+
+    def __remove_source(self, source, keep_file: bool = False):
+        # Open the index first so its consistency check runs against the pre-delete row count
+        with self.index_lock:
+            index = self.get_index()
+            removed = index.remove(self.db.delete_source(source, keep_file))
+        self.__maybe_compact()
+        return removed
+
+    def delete_source(self, source):
+        """
+        Delete every chunk of one source file (e.g. 'books/Sipser-3rd-ed.pdf'); returns how many went.
+
+        The rows are deleted from the database and tombstoned in the index, so searches skip
+        them at once; the next ingest of the folder embeds the file again if it still exists.
+        """
+        return self.__remove_source(source)
+
+    def delete_chunks(self, ids):
+        """Delete chunks by uuid or chunk id and tombstone them in the index; returns how many went."""
+        with self.index_lock:
+            index = self.get_index()
+            removed = index.remove(self.db.delete_chunks(ids))
+        self.__maybe_compact()
+        return removed
+
+    def __maybe_compact(self):
+        """Start a background compaction once the tombstone ratio passes `compact_threshold`."""
+        if not self.compact_threshold:
+            return
+        with self.index_lock:
+            base = getattr(self.index, 'base', self.index)
+            if base is None or len(base) == 0 or base.deleted_count / len(base) < self.compact_threshold:
+                return
+            if self._compaction is not None and not self._compaction.done():
+                return
+            if self._compaction_pool is None:
+                self._compaction_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compaction')
+            self._compaction = self._compaction_pool.submit(self.__compact_in_background)
+
+    def __compact_in_background(self):
+        try:
+            return self.compact()
         except Exception as e:
-            self.logger.error(f"Error loading document: {e}")
+            self.logger.error(f"Error compacting collection {self.db.collection}: {e}")
             raise
 
+    def compact(self, min_free_ratio: float = 0.1):
+        """
+        Rewrite the vector store without its tombstoned rows, then vacuum the database.
+
+        Live rows are copied to new sidecar files while searches and inserts carry on; only
+        rows added meanwhile are copied under the index lock before the new files replace the
+        old ones. IVF assignments and quantized codes are remapped rather than retrained.
+        Returns the number of rows dropped. A call made while another compaction runs waits
+        for it to finish first.
+        """
+        with self._compact_lock:
+            return self.__compact(min_free_ratio)
+
+    def __compact(self, min_free_ratio):
+        start = time.perf_counter()
+        with self.index_lock:
+            index = self.get_index()
+            base = getattr(index, 'base', index)
+            deleted = base.deleted_mask()
+            if base.store is None or deleted is None or not deleted.any():
+                return 0
+            snapshot = len(base)
+            kept = np.flatnonzero(~deleted)
+        compact_path = os.path.splitext(self.db.db_path)[0] + '.compact'
+        base.store.copy_rows(compact_path, kept)
+
+        with self.index_lock:
+            # Rows appended during the copy go over as they are
+            added = np.arange(snapshot, len(base), dtype=np.int64)
+            base.store.copy_rows(compact_path, added, append=True)
+            rows = np.concatenate([kept, added])
+            # Rows deleted meanwhile stay tombstoned, at their position in the compacted files
+            still_deleted = np.flatnonzero(base.deleted_mask()[rows])
+            if index is not base:
+                index.save_compacted(rows)
+            base.store.replace_with(compact_path, still_deleted)
+            self.index = None
+            self.get_index()
+        dropped = snapshot - kept.shape[0]
+        metrics.increment('compacted_rows_total', dropped)
+        metrics.observe('compaction_seconds', time.perf_counter() - start)
+        self.logger.info(f"Compacted {self.db.collection}: dropped {dropped} rows, {len(rows)} remain.")
+
+        with metrics.timer('vacuum_seconds'):
+            self.db.vacuum(min_free_ratio)
+        return dropped
+
+    def __document_loader(self, custom_path, chunk_size, progress, pdf_paths):
+        """Yield CustomDocument chunks page by page, skipping chunks an earlier run already stored."""
+        self.logger.info(f"Loading document from path: {custom_path}.")
+        document_id = str(custom_path)  # Use custom path as document ID
+        # Imported here: langchain is only needed for ingest, and a query-only start skips it
+        from langchain.docstore.document import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+
+        # Pages arrive in document order, so chunk ordinals (and ids) are deterministic
+        # whatever the worker count.
+        source = done = pending = None
+        ordinal = 0
+        for pdf_path, page_number, text in iter_pages(pdf_paths, self.extract_workers, self.pages_per_task):
+            filename = os.path.basename(pdf_path)
+            if source != f"{document_id}/{filename}":
+                source = f"{document_id}/{filename}"
+                done = progress.get(source, 0)
+                pending = None
+                ordinal = 0
+                if done:
+                    self.logger.info(f"Resuming {filename} after {done} stored chunks.")
+
+            if page_number is None:
+                # End of file; `text` carries the extraction error, if any
+                if text is not None:
+                    continue
+                if pending is not None:
+                    pending.is_last = True
+                    pending.chunk_count = ordinal
+                    yield pending
+                else:
+                    self.db.complete_file(source, ordinal)
+                self.logger.info(f"{filename} split into {ordinal} chunks.")
+                source = None
+                continue
+
+            split_start = time.perf_counter()
+            page_chunks = text_splitter.split_text(text)
+            metrics.observe('ingest_split_seconds', time.perf_counter() - split_start)
+            metrics.increment('ingest_chunks_total', len(page_chunks))
+            for chunk_text in page_chunks:
+                if ordinal >= done:
+                    chunk = CustomDocument(
+                        Document(page_content=chunk_text, metadata={'source': source, 'page': page_number}),
+                        f"{source}_{ordinal}", source, page_number, ordinal, pdf_path
+                    )
+                    # Hold one chunk back so the file's final chunk can be flagged as such
+                    if pending is not None:
+                        yield pending
+                    pending = chunk
+                ordinal += 1
+
+    def __embed_batches(self, chunk_batches):
+        for chunks in chunk_batches:
+            yield from zip(chunks, self.__cached_emb_invoke(chunks))
+
+    def __cached_emb_invoke(self, chunks):
+        """Embed chunks, only sending texts that are neither cached nor repeated within the batch."""
+        if self.cache is None:
+            return self.__emb_invoke(chunks)
+        texts = [chunk.page_content for chunk in chunks]
+        embeddings = self.cache.get_many(texts)
+        missing = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None and text not in missing:
+                missing[text] = len(missing)
+        if missing:
+            from langchain.docstore.document import Document
+
+            pending = list(missing)
+            fresh = self.__emb_invoke([CustomDocument(Document(page_content=text), None) for text in pending])
+            self.cache.put_many(pending, fresh)
+            embeddings = [fresh[missing[text]] if embedding is None else embedding
+                          for text, embedding in zip(texts, embeddings)]
+        metrics.increment('embedding_cache_hits_total', len(texts) - len(missing))
+        metrics.increment('embedding_cache_misses_total', len(missing))
+        self.logger.debug("Embedding cache: %d/%d chunks reused.", len(texts) - len(missing), len(texts))
+        return embeddings
+
     def __emb_invoke(self, chunks):
         try:
             key = os.environ.get('OpenAIKey')
+            metrics.observe_size('embed_batch_size', len(chunks))
 
             if key:
-                self.logger.info(f"Using OpenAI for embedding with key {key}.")
+                from langchain_openai import OpenAI
+
+                self.logger.debug("Using OpenAI for embedding %d chunks.", len(chunks))
                 OpenAI.api_key = key
-                embeddings = [OpenAI.Embedding.create(input=chunk.page_content)['data'][0]['embedding'] for chunk in
-                              chunks]
-                self.logger.info(f"Embedding completed successfully using OpenAI.")
+                with metrics.timer('embed_seconds', backend='openai'):
+                    response = OpenAI.Embedding.create(input=[chunk.page_content for chunk in chunks])
+                embeddings = [item['embedding'] for item in response['data']]
                 return embeddings
             else:
-                self.logger.info(f"Connecting to Ollama for embedding using model {self.emb_model}.")
-
-                ollama = OllamaEmbeddings(
-                    base_url=self.ollama_base_url,
-                    model=self.emb_model
-                )
-                embeddings = ollama.embed_documents([chunk.page_content for chunk in chunks])
-                self.logger.info(f"Embedding completed successfully.")
+                self.logger.debug("Embedding %d chunks with Ollama model %s.", len(chunks), self.emb_model)
+                with metrics.timer('embed_seconds', backend='ollama'):
+                    embeddings = self.client.embed_documents([chunk.page_content for chunk in chunks])
                 return embeddings
         except Exception as e:
             self.logger.error(f"Error during embedding with Ollama: {e}")
@@ -111,61 +377,305 @@ class Embedding:
 
     def __load_to_db(self, chunks, embeddings):
         try:
-            self.logger.info("Loading embeddings to database.")
-            results = []
-            for chunk, embedding in zip(chunks, embeddings):
-                uuid = self.db.add_data(chunk.page_content, str(embedding))
-                self.db.add_embedding(uuid, embedding)
-                results.append(uuid)
-            self.logger.info("Embeddings successfully loaded into database.")
+            self.logger.debug("Loading %d embeddings to database.", len(chunks))
+            progress = {}
+            completed = {}
+            for chunk in chunks:
+                progress[chunk.source] = max(progress.get(chunk.source, 0), chunk.ordinal + 1)
+                if chunk.is_last:
+                    completed[chunk.source] = chunk.chunk_count
+            metrics.observe_size('db_write_batch_size', len(chunks))
+            # Open the index, insert and index under one lock: queries never see rows the index
+            # lacks, and a compaction cannot swap the index between the insert and the append
+            with self.index_lock:
+                # Opened before inserting so its row count still matches the database
+                index = self.get_index()
+                with metrics.timer('db_write_seconds'):
+                    results = self.db.add_chunks(
+                        ((chunk.page_content, embedding, chunk.source, chunk.page, chunk.ordinal, chunk.chunk_id)
+                         for chunk, embedding in zip(chunks, embeddings)),
+                        self.db_batch_size, progress, completed
+                    )
+                if results:
+                    with metrics.timer('index_add_seconds'):
+                        index.add(results, embeddings)
             return results
         except Exception as e:
             self.logger.error(f"Error loading embeddings to database: {e}")
             raise
 
-    def query_embeddings(self, query):
-        self.logger.info("Finding the closest match in the database.")
+    def get_index(self):
+        """
+        Open the collection's memory-mapped vector store as a resident VectorIndex.
+
+        The sidecar files are rebuilt from SQLite only when they are missing or out of
+        step with the database; later inserts are appended incrementally.
+        """
+        with self.index_lock:
+            if self.index is None:
+                store = VectorStore(os.path.splitext(self.db.db_path)[0])
+                expected = self.db.count_embeddings()
+                if not store.exists() or len(store) - store.tombstone_rows.size != expected:
+                    self.logger.info(f"Rebuilding vector store {store.vec_path} from the database.")
+                    # IVF assignments and quantized codes are stored per row; after a rebuild
+                    # the rows no longer line up
+                    stem = os.path.splitext(self.db.db_path)[0]
+                    self.__drop_derived(f"{stem}.ivf.npz", f"{stem}.float16.npz", f"{stem}.int8.npz")
+                    all_embeddings = self.db.get_all_embeddings()
+                    if all_embeddings:
+                        uuids, vectors = zip(*all_embeddings)
+                        store.reset(vectors[0].shape[0])
+                        store.append(list(uuids), np.stack(vectors))
+                    elif store.dim is not None:
+                        store.reset(store.dim)
+                index = VectorIndex(self.metric, store=store)
+                if self.index_type == 'ivf':
+                    index = self.__open_ivf(index)
+                elif self.quantization != 'none':
+                    index = self.__open_quantized(index)
+                self.index = index
+                self.logger.info(f"{self.index_type} index opened with {len(self.index)} vectors.")
+            return self.index
+
+    def __drop_derived(self, *paths):
+        for path in paths:
+            if os.path.exists(path):
+                self.logger.info(f"Removing {path}; it no longer matches the rebuilt vector store.")
+                os.remove(path)
+
+    def __open_ivf(self, base):
+        ivf = IvfIndex(base, path=os.path.splitext(self.db.db_path)[0] + '.ivf.npz',
+                       nprobe=int(self.db.get_meta('ivf_nprobe', '8')))
+        if not ivf.load() and len(base) > 0:
+            n_lists = self.db.get_meta('ivf_lists')
+            ivf.train(int(n_lists) if n_lists else None)
+            ivf.save()
+        return ivf
+
+    def __open_quantized(self, base):
+        quantized = QuantizedIndex(base, self.quantization,
+                                   path=f"{os.path.splitext(self.db.db_path)[0]}.{self.quantization}.npz",
+                                   rerank_factor=int(self.db.get_meta('rerank_factor', '4')))
+        if not quantized.load() and len(base) > 0:
+            quantized.fit()
+            quantized.save()
+        return quantized
+
+    def configure_quantization(self, mode: str, rerank_factor: int = 4, sample_queries: int = 100, k: int = 10):
+        """
+        Select scalar quantization ('none', 'float16' or 'int8') for this collection's flat index.
+
+        The codes are refitted, and the memory saved, latency change and recall@k against
+        full-precision search are measured with sampled stored vectors; the report is returned.
+        """
+        if mode not in ('none', 'float16', 'int8'):
+            raise ValueError(f"Unsupported quantization '{mode}'.")
+        if mode != 'none' and self.index_type == 'ivf':
+            raise ValueError("Quantization applies to the flat index; switch with configure_index('flat') first.")
+        self.db.set_meta('quantization', mode)
+        self.db.set_meta('rerank_factor', rerank_factor)
+        self.quantization = mode
+        self.index = None
+        if mode == 'none':
+            return None
+        codes_path = f"{os.path.splitext(self.db.db_path)[0]}.{mode}.npz"
+        if os.path.exists(codes_path):
+            os.remove(codes_path)
+        index = self.get_index()
+        if not isinstance(index, QuantizedIndex) or len(index) == 0:
+            return None
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), size=min(sample_queries, len(index)), replace=False)
+        return index.evaluate(index.base.matrix[np.sort(rows)], k)
+
+    def configure_index(self, index_type: str, n_lists: int = None, nprobe: int = 8, sample_queries: int = 100,
+                        k: int = 10):
+        """
+        Select the index for this collection ('flat' or 'ivf') and persist the choice.
+
+        For IVF the centroids are retrained, and recall@k against exact search is measured
+        with a sample of stored vectors as queries; the report is returned.
+        """
+        if index_type not in ('flat', 'ivf'):
+            raise ValueError(f"Unsupported index type '{index_type}'.")
+        self.db.set_meta('index_type', index_type)
+        self.index_type = index_type
+        self.index = None
+        if index_type == 'flat':
+            return None
+
+        self.db.set_meta('ivf_nprobe', nprobe)
+        if n_lists:
+            self.db.set_meta('ivf_lists', n_lists)
+        # Drop saved centroids so get_index retrains with the new parameters
+        ivf_path = os.path.splitext(self.db.db_path)[0] + '.ivf.npz'
+        if os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        base = self.get_index().base
+        if not isinstance(self.index, IvfIndex) or len(base) == 0:
+            return None
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(base), size=min(sample_queries, len(base)), replace=False)
+        return self.index.evaluate_recall(base.matrix[np.sort(rows)], k)
+
+    SEARCH_MODES = ('vector', 'lexical', 'hybrid')
+
+    def query_embeddings(self, query, top_k: int = 1, source: str = None, folder: str = None,
+                         mode: str = 'vector', rrf_k: int = 60):
+        """
+        Return the top_k (uuid, score) matches for a query, best first.
+
+        `mode` selects nearest-vector search, BM25 full-text search ('lexical'), or 'hybrid',
+        which runs both retrievers concurrently and merges their candidates with reciprocal
+        rank fusion (score = sum of 1 / (rrf_k + rank)). `source` (e.g.
+        'books/Sipser-3rd-ed.pdf') and `folder` (e.g. 'books') restrict the search; the filter
+        is resolved through the database index first, so only the matching rows are scored.
+        Per-stage latencies of the last query are kept in `last_timings`.
+        """
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode '{mode}', expected one of {self.SEARCH_MODES}.")
+        self.logger.debug("Finding the %d closest matches in the database (%s search).", top_k, mode)
+        start = time.perf_counter()
+        self.last_timings = {}
+
+        if mode == 'lexical':
+            matches = self.__lexical_search(query, top_k, source, folder)
+        elif mode == 'vector':
+            matches = self.__vector_search(query, top_k, source, folder)
+        else:
+            # Fuse deeper candidate lists than the caller asked for, so either retriever can
+            # promote a match the other ranked low
+            depth = max(4 * top_k, 20)
+            # Open the index up front rather than racing the lexical query for the connection
+            self.get_index()
+            if self._search_pool is None:
+                self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hybrid-search')
+            lexical = self._search_pool.submit(self.__lexical_search, query, depth, source, folder)
+            vector = self._search_pool.submit(self.__vector_search, query, depth, source, folder)
+            lexical_matches, vector_matches = lexical.result(), vector.result()
+            fusion_start = time.perf_counter()
+            matches = self.reciprocal_rank_fusion([lexical_matches, vector_matches], rrf_k)[:top_k]
+            self.last_timings['fusion_ms'] = 1000.0 * (time.perf_counter() - fusion_start)
+
+        self.last_timings['total_ms'] = 1000.0 * (time.perf_counter() - start)
+        for stage, ms in self.last_timings.items():
+            metrics.observe('query_stage_seconds', ms / 1000.0, stage=stage[:-3], mode=mode)
+        metrics.increment('queries_total', mode=mode)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Closest matches found: %s (%s)", [uuid for uuid, _ in matches],
+                              ', '.join(f'{stage} {ms:.1f}' for stage, ms in self.last_timings.items()))
+        return matches
+
+    @staticmethod
+    def reciprocal_rank_fusion(rankings, rrf_k: int = 60):
+        """Merge ranked [(uuid, score)] lists by reciprocal rank; returns [(uuid, fused score)], best first."""
+        fused = {}
+        for ranking in rankings:
+            for rank, (uuid, _) in enumerate(ranking, start=1):
+                fused[uuid] = fused.get(uuid, 0.0) + 1.0 / (rrf_k + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    def __lexical_search(self, query, top_k, source, folder):
+        start = time.perf_counter()
+        matches = self.db.lexical_search(query, top_k, source, folder)
+        self.last_timings['lexical_ms'] = 1000.0 * (time.perf_counter() - start)
+        return matches
+
+    def __vector_search(self, query, top_k, source, folder):
+        start = time.perf_counter()
+        index = self.get_index()
+        rows = None
+        if source is not None or folder is not None:
+            base = getattr(index, 'base', index)
+            chunk_ids = self.db.filter_chunks(source, folder)
+            # rows_for may build the id -> row map, which must not race the ingest worker's index.add
+            with self.index_lock:
+                rows = base.rows_for(chunk_ids)
+            if rows.size == 0:
+                return []
+        embed_start = time.perf_counter()
+        query_embedding = self.__embed_query(query)
+        search_start = time.perf_counter()
+
+        with self.index_lock:
+            if rows is None:
+                matches = index.search(query_embedding, top_k)
+            else:
+                matches = base.search(query_embedding, top_k, rows=rows)
+        end = time.perf_counter()
+        self.last_timings['embed_ms'] = 1000.0 * (search_start - embed_start)
+        self.last_timings['vector_ms'] = 1000.0 * (end - search_start + embed_start - start)
+        return matches
 
-        # Fetch all embeddings from the database
-        all_embeddings = self.db.get_all_embeddings()
+    def embed_queries(self, queries):
+        """Embed several query texts, sending only the uncached ones in one client call; returns a (n, dim) matrix."""
+        queries = list(queries)
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        metrics.observe_size('query_batch_size', len(queries))
+        if missing:
+            with metrics.timer('query_embed_seconds'):
+                fresh = dict(zip(missing, np.asarray(self.client.embed_documents(missing), dtype=np.float32)))
+            for query, vector in fresh.items():
+                self.query_cache.put(query, vector)
+            vectors = [fresh[query] if vector is None else vector for query, vector in zip(queries, vectors)]
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
 
-        # Convert query to numpy array
-        query_embedding = np.array(self.__embed_query(query))
+    def search_batch(self, query_vectors, top_k: int = 1):
+        """
+        Top_k (uuid, score) matches for each of several query vectors.
 
-        closest_match = None
-        min_distance = float('inf')
+        The flat index answers the whole batch with matrix-matrix products; IVF and quantized
+        indexes search the queries one by one.
+        """
+        index = self.get_index()
+        with self.index_lock, metrics.timer('index_search_batch_seconds'):
+            if hasattr(index, 'search_batch'):
+                return index.search_batch(query_vectors, top_k)
+            return [index.search(query_vector, top_k) for query_vector in query_vectors]
 
-        for uuid, db_embedding in all_embeddings:
-            # Calculate distance
-            try:
-                distance = np.linalg.norm(query_embedding - db_embedding)
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_match = [uuid, db_embedding]
-            except Exception as e:
-                self.logger.error(f"Error calculating distance: {e}")
+    def query_batch(self, queries, top_k: int = 1, batch_size: int = 256):
+        """
+        Top_k (uuid, score) matches for each of many query texts, in input order.
 
-        self.logger.info(f"Closest match found: {closest_match}")
-        return closest_match
+        Queries are embedded `batch_size` at a time (repeats and cached queries are not sent
+        again), and each batch is scored against the whole collection with matrix-matrix
+        products rather than one scan per query.
+        """
+        queries = list(queries)
+        results = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            results.extend(self.search_batch(self.embed_queries(batch), top_k))
+            self.logger.debug("Batch query: %d/%d queries answered.", len(results), len(queries))
+        metrics.increment('queries_total', len(queries), mode='batch')
+        return results
 
     def __embed_query(self, query):
         try:
-            self.logger.info(f"Embedding the query: {query}.")
-            ollama = OllamaEmbeddings(
-                base_url=self.ollama_base_url,
-                model=self.emb_model
-            )
-            query_embedding = ollama.embed_documents([query])[0]
-            return np.array(query_embedding)
+            query_embedding = self.query_cache.get(query)
+            if query_embedding is None:
+                self.logger.debug("Embedding the query: %s.", query)
+                # The long-lived client reuses its pooled keep-alive connections
+                query_embedding = np.asarray(self.client.embed_query(query), dtype=np.float32)
+                self.query_cache.put(query, query_embedding)
+            return query_embedding
         except Exception as e:
             self.logger.error(f"Error embedding query: {e}")
             raise
 
 
 class CustomDocument:
-    def __init__(self, document: Document, chunk_id: str):
+    def __init__(self, document: 'Document', chunk_id: str, source: str = None, page: int = None, ordinal: int = None,
+                 path: str = None):
         self.document = document
         self.chunk_id = chunk_id
+        self.source = source
+        self.page = page
+        self.ordinal = ordinal
+        self.path = path
+        self.is_last = False
+        self.chunk_count = None
 
     @property
     def page_content(self):
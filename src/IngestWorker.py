@@ -0,0 +1,102 @@
+import logging
+import threading
+
+from src.Metrics import metrics
+
+
+class IngestWorker:
+    """
+    Runs queued ingest jobs on a background thread while the collection keeps serving queries.
+
+    Jobs live in the collection database (`ingest_jobs`), so a job queued or interrupted in
+    one run is picked up by the next. Every DB batch of an ingest commits and is searchable
+    on its own; `stop` finishes the batch in flight and puts the job back in the queue.
+    """
+
+    def __init__(self, embedding, poll_interval: float = 1.0):
+        self.logger = logging.getLogger(__name__)
+        self.embedding = embedding
+        self.db = embedding.db
+        self.poll_interval = poll_interval
+        self.current = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def enqueue(self, document_path, chunk_size: int = 500):
+        """Queue an ingest of documents/<document_path>; returns the job id."""
+        job_id = self.db.enqueue_job(document_path, chunk_size)
+        self.logger.info(f"Queued ingest job {job_id} for {document_path}.")
+        self._wake.set()
+        return job_id
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        requeued = self.db.requeue_interrupted_jobs()
+        if requeued:
+            self.logger.info(f"Resuming {requeued} interrupted ingest job(s).")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ingest-worker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stop after the DB batch in flight; an unfinished job is left queued for the next start."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning("Ingest worker did not stop within the timeout.")
+        else:
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        """The job in progress (or None) and the most recent jobs, as dicts."""
+        return {'running': self.is_running(), 'current': dict(self.current) if self.current else None,
+                'jobs': self.db.get_jobs()}
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.db.claim_job()
+            except Exception as e:
+                self.logger.error(f"Error claiming an ingest job: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._process(*job)
+
+    def _process(self, job_id, document_path, chunk_size):
+        self.current = {'id': job_id, 'path': document_path, 'chunks_done': 0}
+        self.logger.info(f"Ingest job {job_id} started for {document_path}.")
+
+        def on_batch(chunks_done):
+            self.current['chunks_done'] = chunks_done
+            self.db.update_job(job_id, chunks_done=chunks_done)
+
+        try:
+            self.embedding.ingest(document_path, chunk_size, should_stop=self._stop.is_set, on_batch=on_batch)
+            if self._stop.is_set():
+                # Checkpoints let the next run continue where this one stopped
+                self.db.update_job(job_id, status='queued')
+            else:
+                self.db.update_job(job_id, status='done')
+                metrics.increment('ingest_jobs_total', status='done')
+                self.logger.info(f"Ingest job {job_id} finished: {self.current['chunks_done']} chunks stored.")
+        except Exception as e:
+            self.logger.error(f"Ingest job {job_id} for {document_path} failed: {e}")
+            metrics.increment('ingest_jobs_total', status='failed')
+            try:
+                self.db.update_job(job_id, status='failed', error=str(e))
+            except Exception as update_error:
+                self.logger.error(f"Error recording the failure of ingest job {job_id}: {update_error}")
+        finally:
+            self.current = None
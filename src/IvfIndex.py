@@ -0,0 +1,187 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+
+class IvfIndex:
+    """
+    Inverted-file (IVF) approximate index on top of a VectorIndex.
+
+    Vectors are clustered with k-means; each row is kept in the inverted list of its
+    nearest centroid, and a query only scores the rows in its `nprobe` closest lists.
+    The underlying VectorIndex still owns the vectors and ids, so the IVF layer only
+    persists the centroids and list assignments (<collection>.ivf.npz).
+    """
+
+    def __init__(self, base, path: str = None, nprobe: int = 8):
+        self.logger = logging.getLogger(__name__)
+        self.base = base
+        self.metric = base.metric
+        self.path = path
+        self.nprobe = nprobe
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = []
+
+    def __len__(self):
+        return len(self.base)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == 'cosine':
+            # Spherical k-means: cluster on the unit sphere so centroids follow angular distance
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+        return vectors
+
+    def _nearest_centroids(self, vectors, n: int = 1, batch_size: int = 8192):
+        vectors = self._prepare(vectors)
+        centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        nearest = np.empty((vectors.shape[0], n), dtype=np.int32)
+        for start in range(0, vectors.shape[0], batch_size):
+            # argmin ||x - c||^2 == argmin ||c||^2 - 2 x.c
+            distances = centroid_sq_norms - 2.0 * (vectors[start:start + batch_size] @ self.centroids.T)
+            if n == 1:
+                nearest[start:start + batch_size, 0] = distances.argmin(axis=1)
+                continue
+            if n < distances.shape[1]:
+                candidates = np.argpartition(distances, n - 1, axis=1)[:, :n]
+            else:
+                candidates = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+            order = np.take_along_axis(distances, candidates, axis=1).argsort(axis=1)
+            nearest[start:start + batch_size] = np.take_along_axis(candidates, order, axis=1)
+        return nearest
+
+    def train(self, n_lists: int = None, iterations: int = 10, sample_size: int = None, seed: int = 0):
+        """Fit centroids with k-means on a sample of the base vectors and assign every row."""
+        total = len(self.base)
+        if total == 0:
+            raise ValueError("Cannot train an IVF index on an empty collection.")
+        n_lists = min(n_lists or max(1, int(4 * np.sqrt(total))), total)
+        sample_size = min(sample_size or n_lists * 256, total)
+
+        start_time = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(total, size=sample_size, replace=False))
+        sample = self._prepare(self.base.matrix[sample_rows])
+        self.centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = self._nearest_centroids(sample)[:, 0]
+            counts = np.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            order = np.argsort(labels, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            self.centroids[filled] = sums / counts[filled, None]
+            if self.metric == 'cosine':
+                self.centroids = self._prepare(self.centroids)
+            # Re-seed empty clusters from random sample points so every list stays usable
+            empty = np.flatnonzero(~filled)
+            if empty.size:
+                self.centroids[empty] = sample[rng.choice(sample_size, size=empty.size, replace=False)]
+
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._assign_new_rows()
+        self.logger.info(f"Trained IVF index with {n_lists} lists on {sample_size} vectors "
+                         f"in {time.perf_counter() - start_time:.2f}s.")
+
+    def _assign_new_rows(self):
+        """Put base rows that have no list yet into their nearest list."""
+        start = self._assignments.shape[0]
+        end = len(self.base)
+        if start >= end:
+            return
+        labels = self._nearest_centroids(self.base.matrix[start:end])[:, 0]
+        self._assignments = np.concatenate([self._assignments, labels])
+        rows = np.arange(start, end, dtype=np.int64)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(self._lists) + 1))
+        for list_id in np.unique(labels):
+            new_rows = rows[order[bounds[list_id]:bounds[list_id + 1]]]
+            self._lists[list_id] = np.concatenate([self._lists[list_id], new_rows])
+
+    def add(self, ids, vectors):
+        """Append to the base index and file the new rows under their nearest centroid."""
+        self.base.add(ids, vectors)
+        if self.trained:
+            self._assign_new_rows()
+
+    def remove(self, ids):
+        # Rows stay in their inverted lists; the base index masks them out of every search
+        return self.base.remove(ids)
+
+    def search(self, query, k: int = 1, nprobe: int = None):
+        if not self.trained:
+            return self.base.search(query, k)
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        probes = self._nearest_centroids(np.atleast_2d(query), nprobe)[0]
+        rows = np.concatenate([self._lists[list_id] for list_id in probes])
+        if rows.size == 0:
+            return []
+        return self.base.search(query, k, rows=np.sort(rows))
+
+    def save(self):
+        if self.path is None or not self.trained:
+            return
+        with open(self.path, 'wb') as file:
+            np.savez(file, centroids=self.centroids, assignments=self._assignments)
+        self.logger.info(f"IVF index saved to {self.path}.")
+
+    def save_compacted(self, rows):
+        """Save the assignments of the given base rows only, for the store compaction is about to install."""
+        if self.path is None or not self.trained:
+            return
+        with open(self.path, 'wb') as file:
+            np.savez(file, centroids=self.centroids, assignments=self._assignments[rows])
+
+    def load(self):
+        """Restore centroids and assignments; rows appended since the last save are assigned now."""
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            self.centroids = data['centroids']
+            assignments = data['assignments']
+        if assignments.shape[0] > len(self.base):
+            self.logger.warning(f"{self.path} is ahead of the vector store; it needs retraining.")
+            self.centroids = None
+            return False
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(self.centroids.shape[0] + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(self.centroids.shape[0])]
+        self._assignments = assignments.astype(np.int32)
+        self._assign_new_rows()
+        return True
+
+    def evaluate_recall(self, queries, k: int = 10, nprobe: int = None):
+        """Measure recall@k and mean latency of this index against exact search on the same data."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        hits = 0
+        approx_seconds = 0.0
+        exact_seconds = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            exact = {row_id for row_id, _ in self.base.search(query, k)}
+            exact_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            approx = {row_id for row_id, _ in self.search(query, k, nprobe)}
+            approx_seconds += time.perf_counter() - start
+            hits += len(exact & approx)
+        report = {
+            'recall_at_k': hits / max(1, min(k, len(self.base)) * len(queries)),
+            'k': k,
+            'nprobe': min(nprobe or self.nprobe, len(self._lists)),
+            'queries': len(queries),
+            'approx_ms': 1000.0 * approx_seconds / max(1, len(queries)),
+            'exact_ms': 1000.0 * exact_seconds / max(1, len(queries)),
+        }
+        self.logger.info(f"IVF recall@{k} = {report['recall_at_k']:.3f} (nprobe={report['nprobe']}), "
+                         f"{report['approx_ms']:.2f} ms vs {report['exact_ms']:.2f} ms exact per query.")
+        return report
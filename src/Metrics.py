@@ -0,0 +1,186 @@
+import bisect
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for latency histograms, (items) for batch-size histograms and
+# (items per second) for throughput histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, cheap enough for per-batch and per-query use.
+
+    Metrics are identified by a name plus optional labels, e.g.
+    `metrics.observe('query_seconds', 0.012, mode='hybrid')`. `timer` records how long a
+    block took into a latency histogram. The registry renders in the Prometheus text
+    exposition format or as a JSON-ready dict, and can dump itself to a file periodically.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_size(self, name, value, **labels):
+        self.observe(name, value, SIZE_BUCKETS, **labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self):
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum,
+                           'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                           'p99': histogram.quantile(0.99),
+                           'buckets': dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'],
+                                               histogram.counts))}
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+        return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{str(value)}"' for key, value in pairs) + '}'
+
+    def render_prometheus(self):
+        """Text exposition format, one TYPE line per metric family."""
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(f'{name}{self._labels(labels)} {value}')
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in histogram.buckets] + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{self._labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{self._labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_json(self, path):
+        # Write then rename, so a reader never sees a half-written file
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        os.replace(temporary, path)
+
+    def start_json_dump(self, path, interval: float = 60.0):
+        """Dump the metrics to `path` every `interval` seconds on a daemon thread."""
+        if self._dump_thread is not None:
+            return
+        self._dump_stop.clear()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                try:
+                    self.dump_json(path)
+                except OSError as e:
+                    self.logger.error(f"Error writing metrics to {path}: {e}")
+
+        self._dump_thread = threading.Thread(target=run, name='metrics-dump', daemon=True)
+        self._dump_thread.start()
+
+    def stop_json_dump(self, path=None):
+        if self._dump_thread is None:
+            return
+        self._dump_stop.set()
+        self._dump_thread.join()
+        self._dump_thread = None
+        if path:
+            self.dump_json(path)
+
+
+metrics = MetricsRegistry()
+
+
+def profile_call(function, *args, sort: str = 'cumulative', limit: int = 30, **kwargs):
+    """
+    Run one call under cProfile; returns (result, report) where report is the pstats text.
+
+    Only the calling thread is profiled, so call it on the thread that does the work.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        profiler.disable()
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.Metrics import metrics
+
+
+class MultiCollectionSearch:
+    """
+    Fans one query out to several collections (one Embedding, database and index each) and
+    merges their top-k lists into a global top-k.
+
+    Each collection is searched on its own pool thread. The index scans run in numpy and
+    release the GIL, so the shards are scanned in parallel. Shards stay independent: each
+    is ingested, grown and compacted on its own, and shards can be added while serving.
+
+    A vector query is embedded once per embedding model and reused by every shard of that
+    model. Per-collection weights scale the scores before merging. Cosine similarities and
+    lexical/hybrid scores are multiplied by the weight; l2 distances are divided by it. A
+    weight above 1 therefore always favours that collection. All shards must use the same
+    metric, so their vector scores can be compared.
+    """
+
+    def __init__(self, embeddings=None, weights=None, max_workers: int = None):
+        self.logger = logging.getLogger(__name__)
+        self.shards = {}
+        self.weights = {}
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        for collection, embedding in (embeddings or {}).items():
+            self.add(collection, embedding, (weights or {}).get(collection, 1.0))
+
+    @classmethod
+    def open(cls, ollama_url, embedding_model, collections, weights=None, max_workers: int = None, **kwargs):
+        """Open an Embedding per collection name; `kwargs` are passed on to Embedding."""
+        from src.Embeddings import Embedding
+
+        return cls({collection: Embedding(ollama_url, embedding_model, collection, **kwargs)
+                    for collection in collections}, weights, max_workers)
+
+    def add(self, collection, embedding, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError(f"Weight of collection '{collection}' must be positive, got {weight}.")
+        with self._lock:
+            metric = self.metric
+            if metric is not None and embedding.metric != metric:
+                raise ValueError(f"Collection '{collection}' uses the {embedding.metric} metric, "
+                                 f"the other collections use {metric}.")
+            self.shards[collection] = embedding
+            self.weights[collection] = float(weight)
+            # Resize the pool on next use, so every shard can run at once
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def remove(self, collection):
+        with self._lock:
+            self.weights.pop(collection, None)
+            return self.shards.pop(collection, None)
+
+    @property
+    def metric(self):
+        return next(iter(self.shards.values())).metric if self.shards else None
+
+    def search(self, query, top_k: int = 1, mode: str = 'vector', collections=None):
+        """
+        Return the global top_k as [(collection, uuid, score)], best first.
+
+        `collections` restricts the search to some of the shards; `mode` is passed on to
+        Embedding.query_embeddings ('vector', 'lexical' or 'hybrid').
+        """
+        start = time.perf_counter()
+        with self._lock:
+            shards = {collection: embedding for collection, embedding in self.shards.items()
+                      if collections is None or collection in collections}
+            weights = {collection: self.weights[collection] for collection in shards}
+            # Vector scores are l2 distances unless the shards use cosine similarity
+            lower_is_better = mode == 'vector' and self.metric != 'cosine'
+        if not shards:
+            return []
+
+        vectors = self._embed_once(query, shards) if mode == 'vector' else {}
+        # Submit under the lock, so add() cannot shut the pool down in between
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(self.shards)),
+                                                thread_name_prefix='fanout-search')
+            futures = {collection: self._pool.submit(self._search_shard, collection, embedding, query, vectors,
+                                                     top_k, mode)
+                       for collection, embedding in shards.items()}
+        merged = []
+        for collection, future in futures.items():
+            try:
+                matches = future.result()
+            except Exception as e:
+                self.logger.error(f"Error searching collection {collection}: {e}")
+                raise
+            weight = weights[collection]
+            merged.extend((collection, uuid, score / weight if lower_is_better else score * weight)
+                          for uuid, score in matches)
+        merged.sort(key=lambda match: match[2], reverse=not lower_is_better)
+        metrics.observe('fanout_search_seconds', time.perf_counter() - start, mode=mode)
+        self.logger.debug("Fan-out search over %d collections returned %d candidates.", len(shards), len(merged))
+        return merged[:top_k]
+
+    @staticmethod
+    def _embed_once(query, shards):
+        """The query embedded once per embedding model among the shards."""
+        vectors = {}
+        for embedding in shards.values():
+            if embedding.emb_model not in vectors:
+                vectors[embedding.emb_model] = embedding.embed_queries([query])
+        return vectors
+
+    @staticmethod
+    def _search_shard(collection, embedding, query, vectors, top_k, mode):
+        start = time.perf_counter()
+        if mode == 'vector':
+            matches = embedding.search_batch(vectors[embedding.emb_model], top_k)[0]
+        else:
+            matches = embedding.query_embeddings(query, top_k, mode=mode)
+        metrics.observe('fanout_shard_seconds', time.perf_counter() - start, collection=collection)
+        return matches
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
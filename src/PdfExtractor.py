@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from src.Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def count_pages(pdf_path):
+    # PyPDF2 is imported on first use, so query-only processes never load it
+    from PyPDF2 import PdfReader
+
+    with open(pdf_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+
+def extract_pages(pdf_path, start, stop):
+    """Extract the text of pages [start, stop) of one PDF. Runs in a worker process."""
+    from PyPDF2 import PdfReader
+
+    with open(pdf_path, 'rb') as file:
+        reader = PdfReader(file)
+        return [(page_number, reader.pages[page_number].extract_text() or '')
+                for page_number in range(start, min(stop, len(reader.pages)))]
+
+
+def _timed_extract(pdf_path, start, stop):
+    """extract_pages plus the seconds it took, measured inside the worker process."""
+    started = time.perf_counter()
+    pages = extract_pages(pdf_path, start, stop)
+    return pages, time.perf_counter() - started
+
+
+def _record(pages, seconds):
+    metrics.observe('pdf_extract_seconds', seconds)
+    metrics.increment('pdf_pages_total', len(pages))
+
+
+def _safe(function, *args):
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def iter_pages(pdf_paths, workers: int = None, pages_per_task: int = 16):
+    """
+    Extract pages from several PDFs across a process pool, yielding results in document order.
+
+    Files are split into page ranges of `pages_per_task`, so a single large book is spread
+    over all workers too. Yields (pdf_path, page_number, text) for every page and then
+    (pdf_path, None, error) once per file, where error is None on success. At most
+    2 * workers ranges are in flight, keeping memory bounded for large folders.
+    """
+    pdf_paths = list(pdf_paths)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield from _iter_pages_inline(pdf_paths, pages_per_task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        page_counts = list(pool.map(_safe, [count_pages] * len(pdf_paths), pdf_paths))
+        tasks = []
+        for pdf_path, (count, error) in zip(pdf_paths, page_counts):
+            if error is not None:
+                logger.error(f"Error reading PDF file {pdf_path}: {error}")
+                tasks.append((pdf_path, None, None, error))
+                continue
+            for start in range(0, count, pages_per_task):
+                tasks.append((pdf_path, start, start + pages_per_task, None))
+            tasks.append((pdf_path, None, None, None))
+
+        pending = deque()
+        task_iter = iter(tasks)
+        failed = set()
+
+        def submit_next():
+            for pdf_path, start, stop, error in task_iter:
+                future = pool.submit(_safe, _timed_extract, pdf_path, start, stop) if start is not None else None
+                pending.append((pdf_path, future, error))
+                if future is not None:
+                    return
+
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            pdf_path, future, error = pending.popleft()
+            if future is None:
+                # End-of-file marker; it is only reached once every range of the file has been yielded
+                yield pdf_path, None, error or ('extraction failed' if pdf_path in failed else None)
+                continue
+            submit_next()
+            extracted, range_error = future.result()
+            if range_error is not None:
+                logger.error(f"Error reading PDF file {pdf_path}: {range_error}")
+                failed.add(pdf_path)
+                continue
+            if pdf_path in failed:
+                continue
+            pages, seconds = extracted
+            _record(pages, seconds)
+            for page_number, text in pages:
+                yield pdf_path, page_number, text
+
+
+def _iter_pages_inline(pdf_paths, pages_per_task):
+    for pdf_path in pdf_paths:
+        count, error = _safe(count_pages, pdf_path)
+        if error is None:
+            for start in range(0, count, pages_per_task):
+                extracted, error = _safe(_timed_extract, pdf_path, start, start + pages_per_task)
+                if error is not None:
+                    break
+                pages, seconds = extracted
+                _record(pages, seconds)
+                for page_number, text in pages:
+                    yield pdf_path, page_number, text
+        if error is not None:
+            logger.error(f"Error reading PDF file {pdf_path}: {error}")
+        yield pdf_path, None, error
@@ -0,0 +1,70 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def batched(iterable, size: int):
+    """Group an iterable into lists of at most `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(iterable, max_in_flight: int = 2):
+    """
+    Run `iterable` in a background thread and yield its items through a bounded queue.
+
+    The producer blocks once `max_in_flight` items are waiting, so a slow consumer applies
+    backpressure to the stage feeding it. Exceptions raised by the producer are re-raised
+    in the consumer.
+    """
+    items = queue.Queue(maxsize=max(1, max_in_flight))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # Unblock the producer if the consumer stops early
+        stop.set()
+        worker.join()
@@ -0,0 +1,220 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+
+class ScalarQuantizer:
+    """
+    Per-collection scalar quantizer.
+
+    'float16' halves every component; 'int8' maps each dimension linearly onto 256 levels
+    using a per-dimension scale and offset fitted on the stored vectors.
+    """
+
+    MODES = ('float16', 'int8')
+
+    def __init__(self, mode: str, scale=None, offset=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported quantization '{mode}', expected one of {self.MODES}.")
+        self.mode = mode
+        self.scale = scale
+        self.offset = offset
+
+    def fit(self, vectors, batch_size: int = 65536):
+        if self.mode == 'int8':
+            low = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+            high = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+            for start in range(0, vectors.shape[0], batch_size):
+                block = vectors[start:start + batch_size]
+                low = np.minimum(low, block.min(axis=0))
+                high = np.maximum(high, block.max(axis=0))
+            self.offset = low
+            self.scale = np.maximum((high - low) / 255.0, np.finfo(np.float32).tiny).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.mode == 'float16':
+            return vectors.astype(np.float16)
+        levels = np.rint((vectors - self.offset) / self.scale) - 128.0
+        return np.clip(levels, -128, 127).astype(np.int8)
+
+    def decode(self, codes):
+        if self.mode == 'float16':
+            return codes.astype(np.float32)
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.offset
+
+
+class QuantizedIndex:
+    """
+    First-pass scan over quantized codes, then exact re-ranking of the best candidates.
+
+    The codes stay resident (2x or 4x smaller than float32); the top `k * rerank_factor`
+    candidates are re-scored against the full-precision rows of the base VectorIndex, which
+    are only paged in for those rows. Codes and quantizer parameters are persisted next to
+    the collection (<collection>.<mode>.npz); rows appended since are encoded on load.
+    """
+
+    def __init__(self, base, mode: str, path: str = None, rerank_factor: int = 4, block_size: int = 16384,
+                 scan_block: int = 4096):
+        self.logger = logging.getLogger(__name__)
+        self.base = base
+        self.metric = base.metric
+        self.quantizer = ScalarQuantizer(mode)
+        self.path = path
+        self.rerank_factor = rerank_factor
+        self.block_size = block_size
+        self.scan_block = scan_block
+        self.codes = None
+        self._sq_norms = None
+
+    def __len__(self):
+        return len(self.base)
+
+    @property
+    def nbytes(self):
+        return 0 if self.codes is None else self.codes.nbytes + self._sq_norms.nbytes
+
+    def fit(self):
+        """Fit the quantizer on the base vectors and encode all of them."""
+        start = time.perf_counter()
+        self.quantizer.fit(self.base.matrix)
+        self.codes = None
+        self._sync()
+        self.logger.info(f"Quantized {len(self.base)} vectors to {self.quantizer.mode} "
+                         f"in {time.perf_counter() - start:.2f}s.")
+
+    def _sync(self):
+        """Encode base rows that have no code yet."""
+        start = 0 if self.codes is None else self.codes.shape[0]
+        if start >= len(self.base) and self.codes is not None:
+            return
+        new_codes = [self.quantizer.encode(self.base.matrix[i:i + self.block_size])
+                     for i in range(start, len(self.base), self.block_size)]
+        new_norms = [np.einsum('ij,ij->i', decoded, decoded)
+                     for decoded in (self.quantizer.decode(codes) for codes in new_codes)]
+        if self.codes is None:
+            dtype = np.float16 if self.quantizer.mode == 'float16' else np.int8
+            self.codes = np.empty((0, self.base.dim), dtype=dtype)
+            self._sq_norms = np.empty(0, dtype=np.float32)
+        self.codes = np.concatenate([self.codes] + new_codes)
+        self._sq_norms = np.concatenate([self._sq_norms] + new_norms)
+
+    def add(self, ids, vectors):
+        self.base.add(ids, vectors)
+        if self.codes is not None:
+            self._sync()
+
+    def remove(self, ids):
+        return self.base.remove(ids)
+
+    def approximate_scores(self, query):
+        """Score every row from its quantized code, block by block to bound temporary memory."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self.quantizer.mode == 'int8':
+            # x ~ (q + 128) * scale + offset, so x.query = q.(scale*query) + (128*scale + offset).query
+            weights = self.quantizer.scale * query
+            constant = float((128.0 * self.quantizer.scale + self.quantizer.offset) @ query)
+        else:
+            weights = query
+            constant = 0.0
+        dots = np.empty(self.codes.shape[0], dtype=np.float32)
+        # Widen one cache-sized block at a time into a reused float32 buffer
+        buffer = np.empty((min(self.scan_block, self.codes.shape[0]), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], self.scan_block):
+            block = self.codes[start:start + self.scan_block]
+            widened = buffer[:block.shape[0]]
+            np.copyto(widened, block, casting='unsafe')
+            np.matmul(widened, weights, out=dots[start:start + block.shape[0]])
+        dots += constant
+        query_sq_norm = float(query @ query)
+        if self.metric == 'cosine':
+            scores = dots / np.maximum(np.sqrt(self._sq_norms * query_sq_norm), np.finfo(np.float32).tiny)
+        else:
+            scores = np.sqrt(np.maximum(self._sq_norms - 2.0 * dots + query_sq_norm, 0.0))
+        deleted = self.base.deleted_mask()
+        if deleted is not None:
+            scores[deleted] = -np.inf if self.metric == 'cosine' else np.inf
+        return scores
+
+    def search(self, query, k: int = 1):
+        if self.codes is None or len(self.base) == 0:
+            return self.base.search(query, k)
+        scores = self.approximate_scores(query)
+        candidates = self.base.top_k(scores, k * self.rerank_factor)
+        candidates = candidates[np.isfinite(scores[candidates])]
+        if candidates.size == 0:
+            return []
+        return self.base.search(query, k, rows=np.sort(candidates))
+
+    def save(self):
+        if self.path is None or self.codes is None:
+            return
+        params = {} if self.quantizer.mode == 'float16' else {'scale': self.quantizer.scale,
+                                                                'offset': self.quantizer.offset}
+        with open(self.path, 'wb') as file:
+            np.savez(file, codes=self.codes, **params)
+        self.logger.info(f"Quantized codes saved to {self.path}.")
+
+    def save_compacted(self, rows):
+        """Save the codes of the given base rows only, for the store compaction is about to install."""
+        if self.path is None or self.codes is None:
+            return
+        params = {} if self.quantizer.mode == 'float16' else {'scale': self.quantizer.scale,
+                                                                'offset': self.quantizer.offset}
+        with open(self.path, 'wb') as file:
+            np.savez(file, codes=self.codes[rows], **params)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            codes = data['codes']
+            if self.quantizer.mode == 'int8':
+                self.quantizer.scale = data['scale']
+                self.quantizer.offset = data['offset']
+        if codes.shape[0] > len(self.base) or codes.shape[1] != self.base.dim:
+            self.logger.warning(f"{self.path} does not match the vector store; it needs refitting.")
+            return False
+        self.codes = codes
+        self._sq_norms = np.concatenate([
+            np.einsum('ij,ij->i', decoded, decoded)
+            for decoded in (self.quantizer.decode(codes[i:i + self.block_size])
+                            for i in range(0, codes.shape[0], self.block_size))
+        ] or [np.empty(0, dtype=np.float32)])
+        self._sync()
+        return True
+
+    def evaluate(self, queries, k: int = 10):
+        """Report memory saved, latency change and recall@k of quantized vs full-precision search."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        hits = 0
+        exact_seconds = 0.0
+        quantized_seconds = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            exact = {row_id for row_id, _ in self.base.search(query, k)}
+            exact_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            approx = {row_id for row_id, _ in self.search(query, k)}
+            quantized_seconds += time.perf_counter() - start
+            hits += len(exact & approx)
+        full_bytes = len(self.base) * self.base.dim * 4
+        report = {
+            'mode': self.quantizer.mode,
+            'k': k,
+            'queries': len(queries),
+            'rerank_factor': self.rerank_factor,
+            'full_bytes': full_bytes,
+            'quantized_bytes': self.nbytes,
+            'memory_saved_bytes': full_bytes - self.nbytes,
+            'exact_ms': 1000.0 * exact_seconds / max(1, len(queries)),
+            'quantized_ms': 1000.0 * quantized_seconds / max(1, len(queries)),
+            'recall_at_k': hits / max(1, min(k, len(self.base)) * len(queries)),
+        }
+        self.logger.info(f"{report['mode']} quantization: {report['memory_saved_bytes'] / 2 ** 20:.1f} MiB saved, "
+                         f"{report['quantized_ms']:.2f} ms vs {report['exact_ms']:.2f} ms per query, "
+                         f"recall@{k} {report['recall_at_k']:.3f} (delta {report['recall_at_k'] - 1.0:+.3f}).")
+        return report
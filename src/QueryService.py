@@ -0,0 +1,385 @@
+# QueryService.py
+#
+# Long-running asyncio HTTP service for retrieval (and, optionally, Agent answers).
+# Usage: python -m src.QueryService [--stub] [--agent] [--host 0.0.0.0] [--port 3000]
+#
+#   GET  /health   liveness, vector count and batching counters
+#   GET  /metrics  Prometheus text exposition of src.Metrics
+#   POST /search   {"query": "...", "top_k": 5, "source": null, "folder": null, "mode": "vector"}
+#   POST /answer   {"query": "..."}   (only with --agent)
+#
+# Adding "profile": true to a /search body runs that request under cProfile and returns the
+# report with the response.
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from src.Metrics import metrics, profile_call
+
+
+class QueryBatcher:
+    """
+    Coalesces plain vector queries that arrive within `max_wait` seconds of each other.
+
+    Each batch costs one embedding call and one matrix-matrix search. Batches run one at a
+    time on the service's index executor, so the next batch fills up while the current one
+    is being answered.
+    """
+
+    def __init__(self, embedding, executor, max_batch: int = 64, max_wait: float = 0.005):
+        self.logger = logging.getLogger(__name__)
+        self.embedding = embedding
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.queries = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Answer everything already queued, then stop."""
+        await self._queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def search(self, query, top_k):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            metrics.observe_size('service_batch_size', len(batch))
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self._search, [query for query, _, _ in batch], max(k for _, k, _ in batch)
+                )
+                for (_, top_k, future), matches in zip(batch, results):
+                    if not future.done():
+                        future.set_result(matches[:top_k])
+            except Exception as e:
+                self.logger.error(f"Error answering a batch of {len(batch)} queries: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                self.batches += 1
+                self.queries += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _search(self, queries, top_k):
+        # Identical texts in one batch are embedded and searched once
+        unique = list(dict.fromkeys(queries))
+        vectors = self.embedding.embed_queries(unique)
+        matches = dict(zip(unique, self.embedding.search_batch(vectors, top_k)))
+        return [matches[query] for query in queries]
+
+
+class QueryService:
+    """
+    Minimal HTTP/1.1 server (keep-alive, JSON bodies) on asyncio streams.
+
+    At most `max_concurrency` requests are processed at once and at most `max_pending` are
+    admitted; beyond that requests get 503 immediately instead of queueing without bound.
+    SIGINT/SIGTERM stop the listener, let admitted requests finish (up to `grace_period`
+    seconds), then close idle connections and the embedding client.
+    """
+
+    def __init__(self, embedding, agent=None, host: str = '127.0.0.1', port: int = 3000, max_batch: int = 64,
+                 max_wait: float = 0.005, max_concurrency: int = 64, max_pending: int = 256,
+                 answer_workers: int = 2, grace_period: float = 10.0, idle_timeout: float = 30.0):
+        self.logger = logging.getLogger(__name__)
+        self.embedding = embedding
+        self.agent = agent
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.grace_period = grace_period
+        self.idle_timeout = idle_timeout
+        # The index and the SQLite connection are used from a single thread
+        self._index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-index')
+        self._answer_executor = ThreadPoolExecutor(max_workers=answer_workers, thread_name_prefix='query-answer')
+        self.batcher = None
+        self.server = None
+        self.started_at = None
+        self.requests = 0
+        self.rejected = 0
+        self._active = 0
+        self._slots = None
+        self._idle = None
+        self._stopping = None
+        self._closing = False
+        self._writers = set()
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = asyncio.Event()
+        # Open the index before accepting traffic so the first request does not pay for it
+        await asyncio.get_running_loop().run_in_executor(self._index_executor, self.embedding.get_index)
+        self.batcher = QueryBatcher(self.embedding, self._index_executor, self.max_batch, self.max_wait)
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started_at = time.monotonic()
+        self.logger.info(f"Query service listening on http://{self.host}:{self.port}")
+
+    def stop(self):
+        """Ask a running `serve()` to shut down gracefully."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def serve(self):
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows, or not on the main thread: rely on stop() / KeyboardInterrupt
+                pass
+        try:
+            await self._stopping.wait()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        if self._closing:
+            return
+        self._closing = True
+        self.logger.info("Shutting down the query service; draining in-flight requests.")
+        self.server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.grace_period)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"{self._active} requests still running after {self.grace_period}s; closing anyway.")
+        for writer in list(self._writers):
+            writer.close()
+        await self.batcher.stop()
+        self._index_executor.shutdown(wait=True)
+        self._answer_executor.shutdown(wait=True)
+        self.embedding.client.close()
+        self.logger.info(f"Query service stopped after {self.requests} requests ({self.rejected} rejected).")
+
+    async def _handle_connection(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while not self._closing:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                        ConnectionError):
+                    break
+                try:
+                    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                    method, path, version = request_line.split(' ', 2)
+                    headers = {}
+                    for line in header_lines:
+                        if ':' in line:
+                            name, value = line.split(':', 1)
+                            headers[name.strip().lower()] = value.strip()
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self._write(writer, HTTPStatus.BAD_REQUEST, {'error': 'malformed request'}, False)
+                    break
+                keep_alive = (headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                              and not self._closing)
+                status, payload = await self._dispatch(method, path.split('?', 1)[0], body)
+                await self._write(writer, status, payload, keep_alive and not self._closing)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def _dispatch(self, method, path, body):
+        if path == '/health' and method == 'GET':
+            return self._health()
+        if path == '/metrics' and method == 'GET':
+            return HTTPStatus.OK, metrics.render_prometheus()
+        routes = {'/search': self._search, '/answer': self._answer}
+        if path not in routes:
+            return HTTPStatus.NOT_FOUND, {'error': f'no route for {path}'}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f'{path} expects POST'}
+        if self._closing:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'shutting down'}
+        if self._active >= self.max_pending:
+            self.rejected += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'overloaded, retry later'}
+
+        self._active += 1
+        self._idle.clear()
+        self.requests += 1
+        try:
+            try:
+                request = json.loads(body or b'{}')
+                query = request['query']
+            except (ValueError, KeyError, TypeError):
+                return HTTPStatus.BAD_REQUEST, {'error': 'expected a JSON body with a "query" field'}
+            async with self._slots:
+                start = time.perf_counter()
+                payload = await routes[path](query, request)
+                elapsed = time.perf_counter() - start
+                metrics.observe('service_request_seconds', elapsed, route=path)
+                payload['took_ms'] = 1000.0 * elapsed
+                return HTTPStatus.OK, payload
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            self.logger.error(f"Error handling {path}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.set()
+
+    def _health(self):
+        index = self.embedding.index
+        payload = {
+            'status': 'draining' if self._closing else 'ok',
+            'collection': self.embedding.db.collection,
+            'vectors': len(index) if index is not None else 0,
+            'uptime_s': time.monotonic() - self.started_at,
+            'active_requests': self._active,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'batches': self.batcher.batches,
+            'batched_queries': self.batcher.queries,
+        }
+        return (HTTPStatus.SERVICE_UNAVAILABLE if self._closing else HTTPStatus.OK), payload
+
+    async def _search(self, query, request):
+        top_k = int(request.get('top_k', 5))
+        source = request.get('source')
+        folder = request.get('folder')
+        mode = request.get('mode', 'vector')
+        loop = asyncio.get_running_loop()
+        profile = None
+        if request.get('profile'):
+            # Profiled on the executor thread, where the work actually runs
+            matches, profile = await loop.run_in_executor(
+                self._index_executor,
+                lambda: profile_call(self.embedding.query_embeddings, query, top_k, source=source, folder=folder,
+                                     mode=mode)
+            )
+        elif mode == 'vector' and source is None and folder is None:
+            matches = await self.batcher.search(query, top_k)
+        else:
+            matches = await loop.run_in_executor(
+                self._index_executor,
+                lambda: self.embedding.query_embeddings(query, top_k, source=source, folder=folder, mode=mode)
+            )
+        chunks = await loop.run_in_executor(self._index_executor, self.embedding.db.get_chunks,
+                                            [uuid for uuid, _ in matches])
+        results = []
+        for uuid, score in matches:
+            chunk_source, page, chunk_index, text = chunks.get(uuid, (None, None, None, None))
+            results.append({'uuid': uuid, 'score': score, 'source': chunk_source, 'page': page,
+                            'chunk_index': chunk_index, 'text': text})
+        payload = {'query': query, 'matches': results}
+        if profile is not None:
+            payload['profile'] = profile
+        return payload
+
+    async def _answer(self, query, request):
+        if self.agent is None:
+            raise ValueError('the answer endpoint is disabled; start the service with --agent')
+        answer = await asyncio.get_running_loop().run_in_executor(self._answer_executor, self.agent.input, query)
+        return {'query': query, 'answer': answer}
+
+
+if __name__ == '__main__':
+    from src.database.Settings import Settings
+    from src.Embeddings import Embedding
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description='Asyncio HTTP retrieval service with query micro-batching.')
+    parser.add_argument('--host', default=settings.get('flask_host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(settings.get('port', '3000')))
+    parser.add_argument('--collection', default=settings.get('collection_name'))
+    parser.add_argument('--max-batch', type=int, default=64, help='most queries coalesced into one batch')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='how long a batch waits to fill up')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='requests processed at once')
+    parser.add_argument('--max-pending', type=int, default=256, help='requests admitted before answering 503')
+    parser.add_argument('--stub', action='store_true',
+                        help='embed with an in-process stub Ollama server instead of the configured one')
+    parser.add_argument('--stub-dim', type=int, default=1024, help='dimension of the stub embeddings')
+    parser.add_argument('--agent', action='store_true', help='enable POST /answer through the Agent')
+    parser.add_argument('--metrics-json', help='also dump the metrics to this JSON file periodically')
+    parser.add_argument('--metrics-interval', type=float, default=60.0, help='seconds between JSON dumps')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    ollama_url = settings.get('ollama_url')
+    embedding_model = settings.get('embedding_model')
+    if args.stub:
+        from src.StubOllamaServer import StubOllamaServer
+
+        stub = StubOllamaServer(dim=args.stub_dim).start()
+        ollama_url, embedding_model = stub.url, 'stub-embed'
+        logging.info(f"Using the stub embedding backend at {stub.url}")
+    # Stub vectors must not evict the real model's entries from the shared embedding cache
+    embedding = Embedding(ollama_url, embedding_model, args.collection, cache_size=0 if args.stub else 100000)
+    agent = None
+    if args.agent:
+        from src.Agent import Agent
+
+        agent = Agent(embedding, ollama_url, settings.get('base_model_name') or 'llama3.1-8b')
+    service = QueryService(embedding, agent, args.host, args.port, args.max_batch, args.max_wait_ms / 1000.0,
+                           args.max_concurrency, args.max_pending)
+    if args.metrics_json:
+        metrics.start_json_dump(args.metrics_json, args.metrics_interval)
+    asyncio.run(service.serve())
+    if args.metrics_json:
+        metrics.stop_json_dump(args.metrics_json)
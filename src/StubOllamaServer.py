@@ -0,0 +1,110 @@
+# StubOllamaServer.py
+#
+# Local stand-in for the Ollama embedding API, for tests and benchmarks.
+# Usage: python -m src.StubOllamaServer --port 11435 --dim 1024
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def stub_vector(text: str, dim: int):
+    """Deterministic pseudo-random vector for a text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """Serves /api/embed, /api/embeddings and /api/tags with deterministic vectors."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, dim: int = 1024, latency: float = 0.0,
+                 failure_rate: float = 0.0):
+        super().__init__((host, port), _StubHandler)
+        self.dim = dim
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY each response on a
+    # keep-alive connection stalls on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._reply(200, {'models': [{'name': 'stub-embed:latest'}]})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        server = self.server
+        server.count_request()
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failure_rate and random.random() < server.failure_rate:
+            self._reply(503, {'error': 'stub failure'})
+            return
+        if self.path == '/api/embed':
+            texts = payload.get('input', [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self._reply(200, {'model': payload.get('model'),
+                              'embeddings': [stub_vector(text, server.dim).tolist() for text in texts]})
+        elif self.path == '/api/embeddings':
+            self._reply(200, {'embedding': stub_vector(payload.get('prompt', ''), server.dim).tolist()})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deterministic stand-in for the Ollama embedding API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to sleep per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = StubOllamaServer(args.host, args.port, args.dim, args.latency, args.failure_rate)
+    logging.info(f"Stub Ollama server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
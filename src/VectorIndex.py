@@ -0,0 +1,252 @@
+import logging
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    Resident vector matrix with precomputed norms for exact top-k search.
+
+    The matrix either lives in process memory (grown geometrically on add) or is a
+    memory-mapped VectorStore, in which case adds are appended to the sidecar files.
+    """
+
+    METRICS = ('cosine', 'l2')
+
+    def __init__(self, metric: str = 'l2', dim: int = None, capacity: int = 1024, store=None):
+        if metric not in self.METRICS:
+            raise ValueError(f"Unsupported metric '{metric}', expected one of {self.METRICS}.")
+        self.logger = logging.getLogger(__name__)
+        self.metric = metric
+        self.dim = dim
+        self.store = store
+        self._ids = []
+        self._size = 0
+        self._capacity = capacity
+        self._matrix = None
+        self._sq_norms = None
+        # Tombstoned rows stay in the matrix but never match; created on first removal
+        self._deleted = None
+        self._rows_by_id = None
+        if store is not None and store.dim is not None:
+            self.dim = store.dim
+            self._sync_store()
+            # .del holds row numbers, so opening costs O(tombstones), not a pass over every id
+            tombstone_rows = store.tombstone_rows
+            if tombstone_rows.size:
+                self._deleted = np.zeros(self._size, dtype=bool)
+                self._deleted[tombstone_rows] = True
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def deleted_count(self):
+        return 0 if self._deleted is None else int(self._deleted[:self._size].sum())
+
+    @property
+    def matrix(self):
+        """View over the populated rows of the matrix."""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    @property
+    def sq_norms(self):
+        # Store-backed norms are computed on first use so opening a collection stays O(1).
+        if self._sq_norms is None or self._sq_norms.shape[0] < self._size:
+            self._sq_norms = self._row_sq_norms(self.matrix)
+        return self._sq_norms[:self._size]
+
+    def id_at(self, row):
+        row_id = self._ids[row]
+        return row_id.decode('ascii') if isinstance(row_id, bytes) else row_id
+
+    @staticmethod
+    def _row_sq_norms(vectors):
+        return np.einsum('ij,ij->i', vectors, vectors)
+
+    def add(self, ids, vectors):
+        """Append vectors (and their ids) to the index."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors.")
+        if vectors.shape[0] == 0:
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}.")
+
+        if self.store is not None:
+            new_norms = self._row_sq_norms(vectors)
+            self.store.append(ids, vectors)
+            if self._sq_norms is not None:
+                self._sq_norms = np.concatenate([self.sq_norms, new_norms])
+            start = self._size
+            self._sync_store()
+            self._index_new_ids(start)
+            return
+
+        self._reserve(self._size + vectors.shape[0])
+        end = self._size + vectors.shape[0]
+        self._matrix[self._size:end] = vectors
+        self._sq_norms[self._size:end] = self._row_sq_norms(vectors)
+        self._ids.extend(ids)
+        self._size = end
+        self._index_new_ids(end - len(ids))
+
+    def _index_new_ids(self, start):
+        if self._rows_by_id is not None:
+            for row in range(start, self._size):
+                self._rows_by_id[self.id_at(row)] = row
+
+    def remove(self, ids):
+        """Tombstone rows by id so searches skip them; returns how many rows were found."""
+        removed = self._mark_deleted(ids)
+        if self.store is not None and removed.size:
+            self.store.tombstone(removed)
+        return int(removed.size)
+
+    def rows_for(self, ids):
+        """Sorted row numbers of the given (live) ids, for restricting a search."""
+        self._ensure_rows_by_id()
+        rows = [self._rows_by_id[row_id] for row_id in ids if row_id in self._rows_by_id]
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def _ensure_rows_by_id(self):
+        if self._rows_by_id is None:
+            deleted = self.deleted_mask()
+            self._rows_by_id = {self.id_at(row): row for row in range(self._size)
+                                if deleted is None or not deleted[row]}
+
+    def _find_rows(self, ids):
+        """Sorted row numbers holding the given ids, deleted or not."""
+        ids = list(ids)
+        if not ids or self._size == 0:
+            return np.empty(0, dtype=np.int64)
+        if self._rows_by_id is None and isinstance(self._ids, np.ndarray):
+            # One vectorized pass over the stored ids rather than a per-row dict of the collection
+            targets = np.unique(np.array([str(row_id).encode('ascii') for row_id in ids], dtype=self._ids.dtype))
+            stored = self._ids[:self._size]
+            positions = np.minimum(np.searchsorted(targets, stored), targets.shape[0] - 1)
+            return np.flatnonzero(targets[positions] == stored)
+        self._ensure_rows_by_id()
+        return np.array(sorted(self._rows_by_id[row_id] for row_id in ids if row_id in self._rows_by_id),
+                        dtype=np.int64)
+
+    def _mark_deleted(self, ids):
+        """Tombstone the live rows holding `ids`; returns their row numbers."""
+        rows = self._find_rows(ids)
+        if self._deleted is None:
+            self._deleted = np.zeros(self._size, dtype=bool)
+        elif self._deleted.shape[0] < self._size:
+            self._deleted = np.concatenate([self._deleted, np.zeros(self._size - self._deleted.shape[0], dtype=bool)])
+        rows = rows[~self._deleted[rows]]
+        self._deleted[rows] = True
+        if self._rows_by_id is not None:
+            for row in rows:
+                self._rows_by_id.pop(self.id_at(row), None)
+        return rows
+
+    def deleted_mask(self, rows=None):
+        if self._deleted is None:
+            return None
+        mask = self._deleted[:self._size]
+        if mask.shape[0] < self._size:
+            mask = np.concatenate([mask, np.zeros(self._size - mask.shape[0], dtype=bool)])
+        return mask if rows is None else mask[rows]
+
+    def _sync_store(self):
+        self._matrix = self.store.vectors
+        self._ids = self.store.ids
+        self._size = len(self.store)
+
+    def _reserve(self, required):
+        if self._matrix is not None and required <= self._matrix.shape[0]:
+            return
+        capacity = max(self._capacity, required)
+        if self._matrix is not None:
+            capacity = max(capacity, self._matrix.shape[0] * 2)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+
+    def scores(self, query, rows=None):
+        """Score every row (or only the given rows) against the query; higher is better for cosine, lower for l2."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match index dimension {self.dim}.")
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        dots = matrix @ query
+        query_sq_norm = float(query @ query)
+        if self.metric == 'cosine':
+            denominator = np.sqrt(sq_norms * query_sq_norm)
+            scores = dots / np.maximum(denominator, np.finfo(np.float32).tiny)
+        else:
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, clipped against rounding below zero
+            scores = np.sqrt(np.maximum(sq_norms - 2.0 * dots + query_sq_norm, 0.0))
+        deleted = self.deleted_mask(rows)
+        if deleted is not None:
+            scores[deleted] = -np.inf if self.metric == 'cosine' else np.inf
+        return scores
+
+    def top_k(self, scores, k):
+        """Positions of the k best scores, best first."""
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        order = -scores if self.metric == 'cosine' else scores
+        if k < scores.shape[0]:
+            candidates = np.argpartition(order, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(order[candidates], kind='stable')]
+
+    def search(self, query, k: int = 1, rows=None):
+        """Return the k best matches as a list of (id, score), best first, optionally restricted to rows."""
+        if self._size == 0:
+            return []
+        scores = self.scores(query, rows)
+        best = self.top_k(scores, k)
+        best = best[np.isfinite(scores[best])]
+        if rows is not None:
+            return [(self.id_at(rows[i]), float(scores[i])) for i in best]
+        return [(self.id_at(i), float(scores[i])) for i in best]
+
+    def search_batch(self, queries, k: int = 1, block_elements: int = 1 << 24):
+        """
+        Search many queries with one matrix-matrix product per block of queries.
+
+        Returns one list of (id, score) per query, as `search` would. Queries are processed
+        in blocks so the score matrix stays under `block_elements` floats.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self._size == 0 or queries.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self.dim}.")
+        deleted = self.deleted_mask()
+        step = max(1, block_elements // self._size)
+        results = []
+        for start in range(0, queries.shape[0], step):
+            block = queries[start:start + step]
+            dots = block @ self.matrix.T
+            query_sq_norms = self._row_sq_norms(block)[:, None]
+            if self.metric == 'cosine':
+                scores = dots / np.maximum(np.sqrt(self.sq_norms[None, :] * query_sq_norms),
+                                           np.finfo(np.float32).tiny)
+            else:
+                scores = np.sqrt(np.maximum(self.sq_norms[None, :] - 2.0 * dots + query_sq_norms, 0.0))
+            if deleted is not None:
+                scores[:, deleted] = -np.inf if self.metric == 'cosine' else np.inf
+            for row_scores in scores:
+                best = self.top_k(row_scores, k)
+                best = best[np.isfinite(row_scores[best])]
+                results.append([(self.id_at(i), float(row_scores[i])) for i in best])
+        return results
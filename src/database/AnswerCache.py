@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.database import VectorBlob
+
+
+class AnswerCache:
+    """
+    Persistent semantic cache of Agent answers, keyed by query embedding.
+
+    A query whose embedding has cosine similarity >= `threshold` with a cached query reuses
+    that answer, provided it has not expired (`ttl` seconds) and the caller confirms the
+    chunks it was built from are still the ones retrieval returns. Entries are evicted
+    least-recently-used beyond `max_entries`. The cache is namespaced per collection and
+    cleared when the embedding model changes.
+    """
+
+    def __init__(self, collection: str, model: str, threshold: float = 0.95, max_entries: int = 1000,
+                 ttl: float = 86400.0, db_name: str = 'answer_cache'):
+        self.logger = logging.getLogger(__name__)
+        self.db_folder = 'data'
+        self.db_path = os.path.join(self.db_folder, db_name + '.db')
+        self.collection = collection
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = None
+
+        os.makedirs(self.db_folder, exist_ok=True)
+        try:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('PRAGMA synchronous = NORMAL')
+            self._create_table()
+            self._check_model()
+            self._load_vectors()
+        except sqlite3.Error as e:
+            self.logger.error(f"Error opening answer cache at {self.db_path}: {e}")
+            raise
+
+    def _create_table(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_collection ON answers (collection, last_used)')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+    def _check_model(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row and row[0] == self.model:
+            return
+        with self.conn:
+            if row:
+                self.logger.info(f"Embedding model changed from {row[0]} to {self.model}; clearing the answer cache.")
+                self.conn.execute('DELETE FROM answers')
+            self.conn.execute('''
+                INSERT INTO meta (key, value) VALUES ('model', ?)
+                ON CONFLICT(key) DO UPDATE SET value=excluded.value
+            ''', (self.model,))
+
+    def _load_vectors(self):
+        """Keep the collection's (unit-normalized) query vectors resident for the similarity scan."""
+        rows = self.conn.execute('''
+            SELECT id, vector FROM answers WHERE collection = ? AND created_at >= ?
+        ''', (self.collection, self._oldest_valid())).fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._vectors = (np.stack([self._normalize(VectorBlob.decode(row[1])) for row in rows])
+                         if rows else None)
+
+    def _oldest_valid(self):
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), np.finfo(np.float32).tiny)
+
+    def lookup(self, vector, is_current=None):
+        """
+        Return the cached answer of the most similar live query, or None.
+
+        `is_current(chunk_ids)` confirms the chunks the answer was built from are unchanged;
+        entries that fail it are deleted.
+        """
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != np.asarray(vector).size:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ self._normalize(vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = int(self._ids[best])
+            try:
+                row = self.conn.execute('''
+                    SELECT answer, chunk_ids FROM answers WHERE id = ? AND created_at >= ?
+                ''', (entry_id, self._oldest_valid())).fetchone()
+                if row is not None and is_current is not None and not is_current(json.loads(row[1])):
+                    self.logger.info("Cached answer is stale: its source chunks changed.")
+                    self.stale += 1
+                    row = None
+                if row is None:
+                    with self.conn:
+                        self.conn.execute('DELETE FROM answers WHERE id = ?', (entry_id,))
+                    self._drop(entry_id)
+                    self.misses += 1
+                    return None
+                with self.conn:
+                    self.conn.execute('UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?',
+                                      (time.time(), entry_id))
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading answer cache: {e}")
+                raise
+            self.hits += 1
+            self.logger.debug("Answer cache hit (similarity %.3f).", similarities[best])
+            return row[0]
+
+    def store(self, query, vector, chunk_ids, answer):
+        now = time.time()
+        with self._lock:
+            try:
+                with self.conn:
+                    cursor = self.conn.execute('''
+                        INSERT INTO answers (collection, query, vector, chunk_ids, answer, created_at, last_used)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (self.collection, query, VectorBlob.encode(vector), json.dumps(list(chunk_ids)), str(answer),
+                          now, now))
+                    entry_id = cursor.lastrowid
+                    evicted = self._evict()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing answer cache: {e}")
+                raise
+            if evicted:
+                self._load_vectors()
+            else:
+                normalized = self._normalize(vector)[None, :]
+                self._ids = np.append(self._ids, entry_id)
+                self._vectors = normalized if self._vectors is None else np.concatenate([self._vectors, normalized])
+
+    def _evict(self):
+        """Delete expired entries and the least recently used beyond max_entries; returns how many went."""
+        removed = self.conn.execute('DELETE FROM answers WHERE collection = ? AND created_at < ?',
+                                    (self.collection, self._oldest_valid())).rowcount
+        excess = self.conn.execute('SELECT COUNT(*) FROM answers WHERE collection = ?',
+                                   (self.collection,)).fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += self.conn.execute('''
+                DELETE FROM answers WHERE id IN (
+                    SELECT id FROM answers WHERE collection = ? ORDER BY last_used LIMIT ?
+                )
+            ''', (self.collection, excess)).rowcount
+        return removed
+
+    def _drop(self, entry_id):
+        keep = self._ids != entry_id
+        self._ids = self._ids[keep]
+        self._vectors = self._vectors[keep] if self._vectors is not None and keep.any() else None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': int(self._ids.size), 'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM answers WHERE collection = ?', (self.collection,))
+            self._ids = np.empty(0, dtype=np.int64)
+            self._vectors = None
+
+    def __del__(self):
+        if getattr(self, 'conn', None):
+            self.conn.close()
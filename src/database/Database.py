@@ -1,14 +1,20 @@
 import sqlite3
 import os
+import re
 import uuid
 import datetime
 import json
 import logging
+import threading
+import time
 
-import numpy as np
+from src.database import VectorBlob
+from src.Metrics import RATE_BUCKETS, metrics
 
 
 class Database:
+    SCHEMA_VERSION = 4
+
     def __init__(self, db_name):
         # Set up logging
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,6 +22,7 @@ class Database:
 
         # Set the path to the 'data' directory and ensure it exists
         self.db_folder = 'data'
+        self.collection = db_name
         self.db_name = db_name + ".db"
         self.db_path = os.path.join(self.db_folder, self.db_name)
         self.logger.info(f"Database path: {self.db_path}")
@@ -31,13 +38,24 @@ class Database:
 
         self.conn = None
         self.cursor = None
+        # Serializes use of the shared connection by the ingest pipeline threads
+        self.lock = threading.RLock()
         self._create_connection()
         self._create_table()
+        self._migrate()
 
     def _create_connection(self):
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             self.cursor = self.conn.cursor()
+            # Lets freed pages be returned with incremental_vacuum; only takes effect on a new file,
+            # older collections are converted by the first vacuum()
+            self.cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL lets readers proceed during bulk writes; NORMAL sync only fsyncs at checkpoints
+            self.cursor.execute('PRAGMA journal_mode = WAL')
+            self.cursor.execute('PRAGMA synchronous = NORMAL')
+            self.cursor.execute('PRAGMA cache_size = -65536')
+            self.cursor.execute('PRAGMA temp_store = MEMORY')
             self.logger.info(f"Connected to SQLite database at {self.db_path}")
         except sqlite3.Error as e:
             self.logger.error(f"Error creating connection to SQLite database at {self.db_path}: {e}")
@@ -45,74 +63,494 @@ class Database:
 
     def _create_table(self):
         try:
+            # One row per chunk: where it came from, its text and its packed vector
             self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS documents (
+                CREATE TABLE IF NOT EXISTS chunks (
                     uuid TEXT PRIMARY KEY,
-                    document_name TEXT,
-                    timestamp TEXT,
-                    data TEXT,
-                    embeddings TEXT,
-                    emb_timestamp TEXT
+                    collection TEXT NOT NULL,
+                    source TEXT,
+                    page INTEGER,
+                    chunk_index INTEGER,
+                    chunk_id TEXT,
+                    text TEXT NOT NULL,
+                    vector BLOB,
+                    created_at TEXT
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source, chunk_index)')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_collection ON chunks (collection, source)')
+            self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_chunk_id ON chunks (chunk_id)')
+            # Full-text index over chunk text for lexical (BM25) retrieval; the triggers keep it in
+            # step with every insert, delete and update of `chunks`
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    text, content='chunks', content_rowid='rowid'
                 )
             ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF text ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                    INSERT INTO chunks_fts (rowid, text) VALUES (new.rowid, new.text);
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_progress (
+                    source TEXT PRIMARY KEY,
+                    chunks_done INTEGER NOT NULL,
+                    updated_at TEXT
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    source TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL,
+                    sha256 TEXT,
+                    status TEXT,
+                    chunk_count INTEGER,
+                    indexed_at TEXT
+                )
+            ''')
+            # Durable queue of background ingest jobs (see IngestWorker)
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, id)')
             self.conn.commit()
-            self.logger.info("Table 'documents' created or already exists.")
+            self.logger.info("Table 'chunks' created or already exists.")
         except sqlite3.Error as e:
             self.logger.error(f"Error creating table: {e}")
             raise
 
-    def add_data(self, document_name, data):
-        document_uuid = str(uuid.uuid4())
-        timestamp = datetime.datetime.now().isoformat()
+    def _migrate(self):
+        """Bring an existing collection up to the current schema version (tracked in PRAGMA user_version)."""
         try:
-            self.cursor.execute('''
-                INSERT INTO documents (uuid, document_name, timestamp, data)
-                VALUES (?, ?, ?, ?)
-            ''', (document_uuid, document_name, timestamp, data))
+            version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+            if version >= self.SCHEMA_VERSION:
+                return
+            legacy = self.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents'"
+            ).fetchone()
+            if legacy:
+                if version < 1:
+                    self._migrate_json_embeddings()
+                if version < 2:
+                    self.cursor.execute('ALTER TABLE documents ADD COLUMN source TEXT')
+                self._migrate_documents_to_chunks()
+            if version < 4:
+                # Index the text of chunks stored before the full-text table existed
+                self.cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            self.cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
             self.conn.commit()
-            self.logger.info(f"Data added with UUID: {document_uuid}")
-            return document_uuid
         except sqlite3.Error as e:
-            self.logger.error(f"Error adding data: {e}")
+            self.conn.rollback()
+            self.logger.error(f"Error migrating database {self.db_path}: {e}")
             raise
 
-    def add_embedding(self, document_uuid, embeddings):
-        emb_timestamp = datetime.datetime.now().isoformat()
-        # Convert the list of embeddings to a JSON string
-        embeddings_str = json.dumps(embeddings)
-        try:
-            self.cursor.execute('''
-                UPDATE documents
-                SET embeddings = ?, emb_timestamp = ?
-                WHERE uuid = ?
-            ''', (embeddings_str, emb_timestamp, document_uuid))
-            self.conn.commit()
-            self.logger.info(f"Embedding added for UUID: {document_uuid}")
-        except sqlite3.Error as e:
-            self.logger.error(f"Error adding embedding: {e}")
-            raise
+    def _migrate_documents_to_chunks(self):
+        """
+        Move rows of the legacy `documents` table into `chunks`.
+
+        `document_name` held the chunk text and `data` a second, textual copy of the vector;
+        the copy is dropped and the text and vector land in their own columns.
+        """
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO chunks (uuid, collection, source, text, vector, created_at)
+            SELECT uuid, ?, source, COALESCE(document_name, ''), embeddings, timestamp FROM documents
+        ''', (self.collection,))
+        self.logger.info(f"Migrated {self.cursor.rowcount} rows from 'documents' to 'chunks' in {self.db_path}.")
+        self.cursor.execute('DROP TABLE documents')
+
+    def _migrate_json_embeddings(self):
+        """One-shot conversion of JSON text embeddings into packed float32 BLOBs."""
+        rows = self.cursor.execute('''
+            SELECT uuid, embeddings FROM documents
+            WHERE typeof(embeddings) = 'text'
+        ''').fetchall()
+        converted = []
+        for document_uuid, embeddings in rows:
+            try:
+                converted.append((VectorBlob.encode(json.loads(embeddings)), document_uuid))
+            except (json.JSONDecodeError, ValueError) as e:
+                self.logger.error(f"Error converting embedding for UUID {document_uuid}: {e}")
+        self.cursor.executemany('UPDATE documents SET embeddings = ? WHERE uuid = ?', converted)
+        if converted:
+            self.logger.info(f"Migrated {len(converted)} JSON embeddings to float32 BLOBs in {self.db_path}.")
+
+    def add_chunks(self, rows, batch_size: int = 500, progress: dict = None, completed: dict = None):
+        """
+        Insert (text, embedding, source, page, chunk_index, chunk_id) rows with executemany,
+        committing once per batch.
+
+        `progress` maps a source file to the number of its chunks stored once these rows are
+        in, and `completed` maps fully ingested source files to their chunk count. Both are
+        written in the same transaction as the final batch, so an interrupted ingest resumes
+        exactly where it stopped. Returns the generated UUIDs in input order.
+        """
+        uuids = []
+        batch = []
+        start = time.perf_counter()
+        with self.lock:
+            try:
+                for text, embedding, source, page, chunk_index, chunk_id in rows:
+                    document_uuid = str(uuid.uuid4())
+                    timestamp = datetime.datetime.now().isoformat()
+                    batch.append((document_uuid, self.collection, source, page, chunk_index, chunk_id, text,
+                                  VectorBlob.encode(embedding), timestamp))
+                    uuids.append(document_uuid)
+                    if len(batch) >= batch_size:
+                        self._insert_batch(batch)
+                        batch = []
+                if batch or progress or completed:
+                    self._insert_batch(batch, progress, completed)
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                self.logger.error(f"Error bulk adding data: {e}")
+                raise
+        elapsed = time.perf_counter() - start
+        rows_per_second = len(uuids) / max(elapsed, 1e-9)
+        if uuids:
+            metrics.observe('db_write_rows_per_second', rows_per_second, RATE_BUCKETS)
+        self.logger.debug("Bulk inserted %d rows in %.2fs (%.0f rows/sec).", len(uuids), elapsed, rows_per_second)
+        return uuids
+
+    def _insert_batch(self, batch, progress: dict = None, completed: dict = None):
+        with self.conn:
+            self.cursor.executemany('''
+                INSERT INTO chunks (uuid, collection, source, page, chunk_index, chunk_id, text, vector, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            timestamp = datetime.datetime.now().isoformat()
+            if progress:
+                self.cursor.executemany('''
+                    INSERT INTO ingest_progress (source, chunks_done, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(source) DO UPDATE SET chunks_done=excluded.chunks_done, updated_at=excluded.updated_at
+                ''', [(source, done, timestamp) for source, done in progress.items()])
+            if completed:
+                self._complete_files(completed, timestamp)
+
+    def _complete_files(self, completed, timestamp):
+        self.cursor.executemany('''
+            UPDATE files SET status = 'done', chunk_count = ?, indexed_at = ? WHERE source = ?
+        ''', [(chunk_count, timestamp, source) for source, chunk_count in completed.items()])
+        self.cursor.executemany('DELETE FROM ingest_progress WHERE source = ?', [(source,) for source in completed])
+
+    def complete_file(self, source, chunk_count):
+        """Mark a file that produced no new chunks as fully ingested."""
+        with self.lock:
+            try:
+                with self.conn:
+                    self._complete_files({source: chunk_count}, datetime.datetime.now().isoformat())
+            except sqlite3.Error as e:
+                self.logger.error(f"Error completing file {source}: {e}")
+                raise
+
+    def get_files(self, prefix=''):
+        """Manifest rows (size, mtime, sha256, status, chunk_count) of files under a source prefix."""
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    SELECT source, size, mtime, sha256, status, chunk_count FROM files
+                    WHERE substr(source, 1, ?) = ?
+                ''', (len(prefix), prefix))
+                return {row[0]: row[1:] for row in self.cursor.fetchall()}
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading file manifest: {e}")
+                raise
+
+    def upsert_file(self, source, size, mtime, sha256, status):
+        with self.lock:
+            try:
+                with self.conn:
+                    self.cursor.execute('''
+                        INSERT INTO files (source, size, mtime, sha256, status) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(source) DO UPDATE SET size=excluded.size, mtime=excluded.mtime,
+                            sha256=excluded.sha256, status=excluded.status
+                    ''', (source, size, mtime, sha256, status))
+            except sqlite3.Error as e:
+                self.logger.error(f"Error updating manifest for {source}: {e}")
+                raise
+
+    def delete_source(self, source, keep_file: bool = False):
+        """Delete every chunk derived from a source file (and its manifest row); returns their UUIDs."""
+        with self.lock:
+            try:
+                with self.conn:
+                    self.cursor.execute('SELECT uuid FROM chunks WHERE source = ?', (source,))
+                    uuids = [row[0] for row in self.cursor.fetchall()]
+                    self.cursor.execute('DELETE FROM chunks WHERE source = ?', (source,))
+                    self.cursor.execute('DELETE FROM ingest_progress WHERE source = ?', (source,))
+                    if not keep_file:
+                        self.cursor.execute('DELETE FROM files WHERE source = ?', (source,))
+                self.logger.info(f"Deleted {len(uuids)} chunks of {source}.")
+                return uuids
+            except sqlite3.Error as e:
+                self.logger.error(f"Error deleting chunks of {source}: {e}")
+                raise
+
+    def delete_chunks(self, ids):
+        """Delete chunks by uuid or chunk id; returns the UUIDs of the rows removed."""
+        ids = list(ids)
+        uuids = []
+        with self.lock:
+            try:
+                with self.conn:
+                    for start in range(0, len(ids), 500):
+                        batch = ids[start:start + 500]
+                        placeholders = ','.join('?' * len(batch))
+                        self.cursor.execute(f'''
+                            SELECT uuid FROM chunks WHERE uuid IN ({placeholders}) OR chunk_id IN ({placeholders})
+                        ''', batch + batch)
+                        found = [row[0] for row in self.cursor.fetchall()]
+                        self.cursor.executemany('DELETE FROM chunks WHERE uuid = ?', ((uuid,) for uuid in found))
+                        uuids.extend(found)
+                self.logger.info(f"Deleted {len(uuids)} chunks.")
+                return uuids
+            except sqlite3.Error as e:
+                self.logger.error(f"Error deleting chunks: {e}")
+                raise
+
+    def vacuum(self, min_free_ratio: float = 0.1):
+        """
+        Return free pages to the file system once they make up `min_free_ratio` of the file.
+
+        Collections created with auto_vacuum=INCREMENTAL only release their free pages; older
+        files get one full VACUUM, which also switches them to incremental mode. Returns the
+        number of pages released.
+        """
+        with self.lock:
+            try:
+                page_count = self.cursor.execute('PRAGMA page_count').fetchone()[0]
+                free_pages = self.cursor.execute('PRAGMA freelist_count').fetchone()[0]
+                if not page_count or free_pages / page_count < min_free_ratio:
+                    return 0
+                if self.cursor.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                    # executescript steps the pragma to completion; execute() frees a single page
+                    self.cursor.executescript('PRAGMA incremental_vacuum;')
+                else:
+                    self.cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    self.conn.commit()
+                    self.cursor.execute('VACUUM')
+                # In WAL mode the file only shrinks once the vacuumed pages are checkpointed
+                self.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                self.logger.info(f"Vacuumed {self.db_path}: released {free_pages} of {page_count} pages.")
+                return free_pages
+            except sqlite3.Error as e:
+                self.logger.error(f"Error vacuuming {self.db_path}: {e}")
+                raise
+
+    def enqueue_job(self, path, chunk_size):
+        """Queue an ingest of documents/<path>; an identical job already waiting is reused. Returns the job id."""
+        with self.lock:
+            try:
+                with self.conn:
+                    row = self.conn.execute('''
+                        SELECT id FROM ingest_jobs WHERE path = ? AND chunk_size = ? AND status = 'queued'
+                    ''', (path, chunk_size)).fetchone()
+                    if row:
+                        return row[0]
+                    return self.conn.execute('''
+                        INSERT INTO ingest_jobs (path, chunk_size, status, created_at) VALUES (?, ?, 'queued', ?)
+                    ''', (path, chunk_size, datetime.datetime.now().isoformat())).lastrowid
+            except sqlite3.Error as e:
+                self.logger.error(f"Error queueing ingest job for {path}: {e}")
+                raise
+
+    def claim_job(self):
+        """Mark the oldest queued job as running and return (id, path, chunk_size), or None."""
+        with self.lock:
+            try:
+                with self.conn:
+                    row = self.conn.execute('''
+                        SELECT id, path, chunk_size FROM ingest_jobs WHERE status = 'queued' ORDER BY id LIMIT 1
+                    ''').fetchone()
+                    if row:
+                        self.conn.execute('''
+                            UPDATE ingest_jobs SET status = 'running', started_at = ?, error = NULL WHERE id = ?
+                        ''', (datetime.datetime.now().isoformat(), row[0]))
+                    return row
+            except sqlite3.Error as e:
+                self.logger.error(f"Error claiming an ingest job: {e}")
+                raise
+
+    def update_job(self, job_id, status=None, chunks_done=None, error=None):
+        finished = datetime.datetime.now().isoformat() if status in ('done', 'failed') else None
+        with self.lock:
+            try:
+                with self.conn:
+                    self.conn.execute('''
+                        UPDATE ingest_jobs SET status = COALESCE(?, status), chunks_done = COALESCE(?, chunks_done),
+                            error = COALESCE(?, error), finished_at = COALESCE(?, finished_at)
+                        WHERE id = ?
+                    ''', (status, chunks_done, error, finished, job_id))
+            except sqlite3.Error as e:
+                self.logger.error(f"Error updating ingest job {job_id}: {e}")
+                raise
+
+    def requeue_interrupted_jobs(self):
+        """Jobs left 'running' by a process that died go back to the queue; ingest checkpoints resume them."""
+        with self.lock:
+            try:
+                with self.conn:
+                    return self.conn.execute(
+                        "UPDATE ingest_jobs SET status = 'queued' WHERE status = 'running'"
+                    ).rowcount
+            except sqlite3.Error as e:
+                self.logger.error(f"Error requeueing interrupted ingest jobs: {e}")
+                raise
+
+    def get_jobs(self, limit: int = 10):
+        """Most recent ingest jobs as dicts, newest first."""
+        with self.lock:
+            try:
+                cursor = self.conn.execute('''
+                    SELECT id, path, chunk_size, status, chunks_done, error, created_at, started_at, finished_at
+                    FROM ingest_jobs ORDER BY id DESC LIMIT ?
+                ''', (limit,))
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading ingest jobs: {e}")
+                raise
+
+    def get_progress(self):
+        """Chunks already stored per source file by earlier, possibly interrupted, ingests."""
+        with self.lock:
+            try:
+                self.cursor.execute('SELECT source, chunks_done FROM ingest_progress')
+                return dict(self.cursor.fetchall())
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading ingest progress: {e}")
+                raise
+
+    def lexical_search(self, query, limit: int = 20, source: str = None, folder: str = None):
+        """
+        BM25-ranked full-text search over chunk text; returns [(uuid, score)], best first.
+
+        Every word of the query is matched as a quoted term and the terms are OR-ed, so exact
+        identifiers (invoice numbers, account ids) match without FTS5 query syntax getting in
+        the way. Scores are negated bm25() values: higher is better.
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        conditions = ['chunks_fts MATCH ?']
+        params = [' OR '.join(f'"{term}"' for term in terms)]
+        if source is not None:
+            conditions.append('chunks.source = ?')
+            params.append(source)
+        if folder is not None:
+            prefix = folder.rstrip('/') + '/'
+            conditions.append('chunks.source >= ? AND chunks.source < ?')
+            params.extend([prefix, prefix + '\U0010ffff'])
+        params.append(limit)
+        with self.lock:
+            try:
+                return self.conn.execute(f'''
+                    SELECT chunks.uuid, -bm25(chunks_fts) AS score
+                    FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY bm25(chunks_fts) LIMIT ?
+                ''', params).fetchall()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error running full-text search: {e}")
+                raise
+
+    def filter_chunks(self, source: str = None, folder: str = None):
+        """
+        UUIDs of the chunks from one source file and/or under one folder, resolved through the
+        source index (a folder becomes a range scan over `source`, not a LIKE).
+        """
+        conditions = []
+        params = []
+        if source is not None:
+            conditions.append('source = ?')
+            params.append(source)
+        if folder is not None:
+            prefix = folder.rstrip('/') + '/'
+            # Every source starting with `prefix` sorts in [prefix, prefix + U+10FFFF)
+            conditions.append('source >= ? AND source < ?')
+            params.extend([prefix, prefix + '\U0010ffff'])
+        with self.lock:
+            try:
+                rows = self.conn.execute(f"SELECT uuid FROM chunks WHERE {' AND '.join(conditions) or '1'}",
+                                         params).fetchall()
+                return [row[0] for row in rows]
+            except sqlite3.Error as e:
+                self.logger.error(f"Error filtering chunks: {e}")
+                raise
+
+    def get_chunks(self, uuids):
+        """Fetch (source, page, chunk_index, text) for many chunks in one read; returns a dict keyed by uuid."""
+        uuids = list(uuids)
+        found = {}
+        with self.lock:
+            try:
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(uuids), 500):
+                    part = uuids[start:start + 500]
+                    rows = self.conn.execute(f'''
+                        SELECT uuid, source, page, chunk_index, text FROM chunks
+                        WHERE uuid IN ({','.join('?' * len(part))})
+                    ''', part).fetchall()
+                    found.update((row[0], row[1:]) for row in rows)
+                return found
+            except sqlite3.Error as e:
+                self.logger.error(f"Error fetching chunks: {e}")
+                raise
 
     def retrieve_data(self, query):
-        try:
-            self.cursor.execute('''
-                SELECT * FROM documents
-                WHERE document_name LIKE ?
-            ''', ('%' + query + '%',))
-            results = self.cursor.fetchall()
-            self.logger.info(f"Data retrieved for query '{query}': {results}")
-            return results
-        except sqlite3.Error as e:
-            self.logger.error(f"Error retrieving data: {e}")
-            raise
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    SELECT uuid, source, page, chunk_index, text FROM chunks
+                    WHERE text LIKE ?
+                ''', ('%' + query + '%',))
+                results = self.cursor.fetchall()
+                self.logger.debug("Data retrieved for query %r: %d rows.", query, len(results))
+                return results
+            except sqlite3.Error as e:
+                self.logger.error(f"Error retrieving data: {e}")
+                raise
 
     def drop_all_data(self):
-        try:
-            self.cursor.execute('DELETE FROM documents')
-            self.conn.commit()
-            self.logger.info("All data dropped from 'documents' table.")
-        except sqlite3.Error as e:
-            self.logger.error(f"Error dropping all data: {e}")
-            raise
+        with self.lock:
+            try:
+                self.cursor.execute('DELETE FROM chunks')
+                # Forget the manifest and checkpoints too, so the next embed starts from scratch
+                self.cursor.execute('DELETE FROM files')
+                self.cursor.execute('DELETE FROM ingest_progress')
+                self.conn.commit()
+                self.logger.info("All data dropped from 'chunks' table.")
+            except sqlite3.Error as e:
+                self.logger.error(f"Error dropping all data: {e}")
+                raise
 
     def get_all_embeddings(self):
         try:
@@ -122,9 +560,9 @@ class Database:
             for uuid, embeddings in results:
                 if embeddings is not None:
                     try:
-                        parsed_results.append((uuid, np.array(json.loads(embeddings))))
-                    except json.JSONDecodeError as e:
-                        logging.error(f"Error decoding JSON for uuid {uuid}: {e}")
+                        parsed_results.append((uuid, VectorBlob.decode(embeddings)))
+                    except (ValueError, TypeError) as e:
+                        logging.error(f"Error decoding embedding for uuid {uuid}: {e}")
                 else:
                     logging.warning(f"Embeddings for uuid {uuid} are None and will be skipped.")
             return parsed_results
@@ -132,16 +570,50 @@ class Database:
             logging.error(f"Error fetching embeddings: {e}")
             raise
 
+    def get_meta(self, key, default=None):
+        """Read a per-collection setting from the meta table."""
+        with self.lock:
+            try:
+                self.cursor.execute('SELECT value FROM meta WHERE key = ?', (key,))
+                row = self.cursor.fetchone()
+                return row[0] if row else default
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading meta key {key}: {e}")
+                raise
+
+    def set_meta(self, key, value):
+        """Write a per-collection setting to the meta table."""
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    INSERT INTO meta (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                ''', (key, str(value)))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing meta key {key}: {e}")
+                raise
+
+    def count_embeddings(self):
+        with self.lock:
+            try:
+                self.cursor.execute('SELECT COUNT(*) FROM chunks WHERE vector IS NOT NULL')
+                return self.cursor.fetchone()[0]
+            except sqlite3.Error as e:
+                self.logger.error(f"Error counting embeddings: {e}")
+                raise
+
     def _fetch_embeddings_from_db(self):
-        try:
-            self.cursor.execute('''
-                SELECT uuid, embeddings FROM documents
-            ''')
-            results = self.cursor.fetchall()
-            return results
-        except sqlite3.Error as e:
-            logging.error(f"Error fetching embeddings from database: {e}")
-            raise
+        with self.lock:
+            try:
+                self.cursor.execute('''
+                    SELECT uuid, vector FROM chunks
+                ''')
+                results = self.cursor.fetchall()
+                return results
+            except sqlite3.Error as e:
+                logging.error(f"Error fetching embeddings from database: {e}")
+                raise
 
     def __del__(self):
         if self.conn:
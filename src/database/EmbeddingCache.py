@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.database import VectorBlob
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embeddings keyed by hash(model name, chunk text).
+
+    Entries are evicted least-recently-used once `max_entries` is exceeded. The cache
+    remembers which embedding model filled it and clears itself when opened for a
+    different one, so changing `embedding_model` in Settings invalidates it automatically.
+    """
+
+    def __init__(self, model: str, max_entries: int = 100000, db_name: str = 'embedding_cache'):
+        self.logger = logging.getLogger(__name__)
+        self.db_folder = 'data'
+        self.db_path = os.path.join(self.db_folder, db_name + '.db')
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.db_folder, exist_ok=True)
+        try:
+            # The cache is used from the ingest pipeline's embedding thread, guarded by _lock
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('PRAGMA synchronous = NORMAL')
+            self._create_table()
+            self._check_model()
+        except sqlite3.Error as e:
+            self.logger.error(f"Error opening embedding cache at {self.db_path}: {e}")
+            raise
+
+    def _create_table(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    key BLOB PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache (last_used)')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+    def _check_model(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row and row[0] == self.model:
+            return
+        with self.conn:
+            if row:
+                self.logger.info(f"Embedding model changed from {row[0]} to {self.model}; clearing the cache.")
+                self.conn.execute('DELETE FROM cache')
+            self.conn.execute('''
+                INSERT INTO meta (key, value) VALUES ('model', ?)
+                ON CONFLICT(key) DO UPDATE SET value=excluded.value
+            ''', (self.model,))
+
+    def _key(self, text):
+        return hashlib.sha256(self.model.encode('utf-8') + b'\0' + text.encode('utf-8')).digest()
+
+    def get_many(self, texts):
+        """Return the cached vector for each text, or None where it is not cached."""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            try:
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(keys), 500):
+                    part = keys[start:start + 500]
+                    rows = self.conn.execute(
+                        f"SELECT key, vector FROM cache WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    found.update(rows)
+                if found:
+                    now = time.time()
+                    with self.conn:
+                        self.conn.executemany('UPDATE cache SET last_used = ? WHERE key = ?',
+                                              [(now, key) for key in found])
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading embedding cache: {e}")
+                raise
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [VectorBlob.decode(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = [(self._key(text), VectorBlob.encode(vector), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            try:
+                with self.conn:
+                    self.conn.executemany('INSERT OR REPLACE INTO cache (key, vector, last_used) VALUES (?, ?, ?)',
+                                          rows)
+                    self._evict()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing embedding cache: {e}")
+                raise
+
+    def _evict(self):
+        excess = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute('''
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY last_used LIMIT ?
+                )
+            ''', (excess,))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM cache')
+
+    def __del__(self):
+        if getattr(self, 'conn', None):
+            self.conn.close()
@@ -0,0 +1,32 @@
+# Migrate.py
+#
+# One-shot migration of every collection under data/ to the current schema.
+# Usage: python -m src.database.Migrate
+
+import glob
+import logging
+import os
+
+from src.database.Database import Database
+
+# Databases under data/ that are not collections
+NON_COLLECTIONS = {'settings', 'embedding_cache', 'answer_cache'}
+
+
+def migrate_all(db_folder='data'):
+    """Open every collection database so its pending migrations run."""
+    migrated = []
+    for db_path in sorted(glob.glob(os.path.join(db_folder, '*.db'))):
+        name = os.path.splitext(os.path.basename(db_path))[0]
+        if name in NON_COLLECTIONS:
+            continue
+        db = Database(name)
+        db.cursor.execute('VACUUM')
+        migrated.append(db.db_path)
+    return migrated
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for path in migrate_all():
+        logging.info(f"Migrated {path}")
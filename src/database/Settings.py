@@ -65,18 +65,33 @@ class Settings:
 
     def set(self, key, value):
         """Set a setting value."""
+        self.update({key: value})
+
+    def update(self, values):
+        """
+        Set several settings in one connection and transaction; returns the keys that changed.
+
+        Values equal to the stored ones are skipped, so re-applying the same settings does
+        not write to the database at all.
+        """
+        # The value column has TEXT affinity, so compare in the form it is read back in
+        changed = {key: None if value is None else str(value) for key, value in values.items()}
+        changed = {key: value for key, value in changed.items()
+                   if key not in self.settings or self.settings[key] != value}
+        if not changed:
+            return []
         try:
             conn = sqlite3.connect(self.settings_db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO settings (key, value) VALUES (?, ?)
-                ON CONFLICT(key) DO UPDATE SET value=excluded.value
-            ''', (key, value))
-            conn.commit()
+            with conn:
+                conn.executemany('''
+                    INSERT INTO settings (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                ''', changed.items())
             conn.close()
-            self.settings[key] = value
+            self.settings.update(changed)
+            return list(changed)
         except sqlite3.Error as e:
-            raise Exception(f"Error setting value: {e}")
+            raise Exception(f"Error setting values: {e}")
 
     def prompt_for_settings(self):
         """Prompt the user to provide missing settings."""
@@ -107,7 +122,6 @@ class Settings:
         """Update settings from a JSON object."""
         try:
             data = json.loads(json_data)
-            for key, value in data.items():
-                self.set(key, value)
+            return self.update(data)
         except json.JSONDecodeError as e:
             raise Exception(f"Error decoding JSON: {e}")
@@ -0,0 +1,46 @@
+import struct
+
+import numpy as np
+
+# Binary layout of a stored vector:
+#   magic (2 bytes) | version (1 byte) | dtype code (1 byte) | dimension (uint32, little endian) | payload
+# The header is 8 bytes so the payload stays aligned for np.frombuffer.
+MAGIC = b'EV'
+VERSION = 1
+HEADER = struct.Struct('<2sBBI')
+HEADER_SIZE = HEADER.size
+
+DTYPE_CODES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+    3: np.dtype('i1'),
+}
+CODE_FOR_DTYPE = {dtype: code for code, dtype in DTYPE_CODES.items()}
+
+
+def encode(vector, dtype='<f4'):
+    """Pack a vector into a BLOB with a dimension and dtype header."""
+    dtype = np.dtype(dtype)
+    if dtype not in CODE_FOR_DTYPE:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    array = np.ascontiguousarray(vector, dtype=dtype).ravel()
+    return HEADER.pack(MAGIC, VERSION, CODE_FOR_DTYPE[dtype], array.shape[0]) + array.tobytes()
+
+
+def decode(blob):
+    """Return a read-only view over the payload of a vector BLOB (no copy)."""
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not an encoded vector (magic={magic!r}, version={version})")
+    if code not in DTYPE_CODES:
+        raise ValueError(f"Unknown vector dtype code: {code}")
+    return np.frombuffer(blob, dtype=DTYPE_CODES[code], count=dim, offset=HEADER_SIZE)
+
+
+def dimension(blob):
+    """Read the dimension from a vector BLOB header without touching the payload."""
+    return HEADER.unpack_from(blob)[3]
+
+
+def is_encoded(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == MAGIC
@@ -0,0 +1,176 @@
+import logging
+import os
+import struct
+
+import numpy as np
+
+
+class VectorStore:
+    """
+    Append-only, memory-mapped vector file kept next to a collection database.
+
+    <collection>.vec holds a 16-byte header (magic, dimension) followed by float32 rows;
+    <collection>.ids holds the matching row ids as fixed-width ASCII records. Both files
+    are opened with np.memmap, so processes share the page cache instead of each
+    decoding the collection into private memory. Removed rows stay in place and their row
+    numbers are appended to <collection>.del until compaction rewrites the files without them.
+    """
+
+    MAGIC = b'EVS1'
+    HEADER = struct.Struct('<4sI8x')
+    # .del files start with this header and hold int64 row numbers; older ones held row ids
+    DEL_MAGIC = b'EVD2'
+    DEL_HEADER = struct.Struct('<4s12x')
+    ID_WIDTH = 36
+
+    def __init__(self, base_path: str):
+        self.logger = logging.getLogger(__name__)
+        self.vec_path = base_path + '.vec'
+        self.ids_path = base_path + '.ids'
+        self.del_path = base_path + '.del'
+        self.dim = None
+        self._vectors = None
+        self._ids = None
+        if self.exists():
+            self._open()
+
+    def exists(self):
+        return os.path.exists(self.vec_path) and os.path.exists(self.ids_path)
+
+    def __len__(self):
+        return 0 if self._ids is None else self._ids.shape[0]
+
+    @property
+    def vectors(self):
+        return self._vectors
+
+    @property
+    def ids(self):
+        return self._ids
+
+    def _read_header(self):
+        with open(self.vec_path, 'rb') as file:
+            magic, dim = self.HEADER.unpack(file.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError(f"{self.vec_path} is not a vector store file.")
+        return dim
+
+    def _open(self):
+        """Map both files, truncating a torn append so rows and ids stay aligned."""
+        self.dim = self._read_header()
+        row_bytes = self.dim * 4
+        vec_rows = (os.path.getsize(self.vec_path) - self.HEADER.size) // row_bytes
+        id_rows = os.path.getsize(self.ids_path) // self.ID_WIDTH
+        count = min(vec_rows, id_rows)
+        if vec_rows != count or id_rows != count:
+            self.logger.warning(f"Truncating {self.vec_path} to {count} consistent rows.")
+            os.truncate(self.vec_path, self.HEADER.size + count * row_bytes)
+            os.truncate(self.ids_path, count * self.ID_WIDTH)
+        self._map(count)
+
+    def _map(self, count):
+        if count == 0:
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            self._ids = np.empty(0, dtype=f'S{self.ID_WIDTH}')
+            return
+        self._vectors = np.memmap(self.vec_path, dtype=np.float32, mode='r',
+                                  offset=self.HEADER.size, shape=(count, self.dim))
+        self._ids = np.memmap(self.ids_path, dtype=f'S{self.ID_WIDTH}', mode='r', shape=(count,))
+
+    def reset(self, dim: int):
+        """Create (or truncate) the sidecar files for vectors of the given dimension."""
+        with open(self.vec_path, 'wb') as file:
+            file.write(self.HEADER.pack(self.MAGIC, dim))
+        for path in (self.ids_path, self.del_path):
+            with open(path, 'wb'):
+                pass
+        self.dim = dim
+        self._map(0)
+
+    def append(self, ids, vectors):
+        """Append rows to both files and remap them."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vectors.shape[0]} vectors.")
+        if vectors.shape[0] == 0:
+            return
+        if self.dim is None:
+            self.reset(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match store dimension {self.dim}.")
+
+        encoded_ids = [str(row_id).encode('ascii') for row_id in ids]
+        if any(len(row_id) > self.ID_WIDTH for row_id in encoded_ids):
+            raise ValueError(f"Row ids longer than {self.ID_WIDTH} characters cannot be stored.")
+        encoded_ids = np.array(encoded_ids, dtype=f'S{self.ID_WIDTH}')
+        # Vectors first: on a crash the ids file is the shorter one and _open trims the excess.
+        with open(self.vec_path, 'ab') as file:
+            file.write(np.ascontiguousarray(vectors, dtype='<f4').tobytes())
+        with open(self.ids_path, 'ab') as file:
+            file.write(encoded_ids.tobytes())
+        self._map(len(self) + vectors.shape[0])
+
+    @property
+    def tombstone_rows(self):
+        """Sorted row numbers of the rows removed from the collection."""
+        if not os.path.exists(self.del_path):
+            return np.empty(0, dtype=np.int64)
+        with open(self.del_path, 'rb') as file:
+            data = file.read()
+        if data and not data.startswith(self.DEL_MAGIC):
+            return self._upgrade_tombstones(data)
+        count = max(0, len(data) - self.DEL_HEADER.size) // 8
+        rows = np.frombuffer(data, dtype='<i8', count=count, offset=min(len(data), self.DEL_HEADER.size))
+        return np.unique(rows[rows < len(self)]).astype(np.int64)
+
+    def _upgrade_tombstones(self, data):
+        """Rewrite a .del file of row ids as row numbers; reading it from then on is O(tombstones)."""
+        usable = len(data) - len(data) % self.ID_WIDTH
+        removed = np.unique(np.frombuffer(data[:usable], dtype=f'S{self.ID_WIDTH}'))
+        rows = np.empty(0, dtype=np.int64)
+        if removed.size and len(self):
+            positions = np.minimum(np.searchsorted(removed, self._ids), removed.shape[0] - 1)
+            rows = np.flatnonzero(removed[positions] == self._ids)
+        self.logger.info(f"Converting {self.del_path} to row numbers ({rows.shape[0]} tombstones).")
+        with open(self.del_path, 'wb'):
+            pass
+        self.tombstone(rows)
+        return rows
+
+    def tombstone(self, rows):
+        """Record removed row numbers; the rows themselves are dropped by compaction."""
+        rows = np.asarray(rows, dtype='<i8')
+        if rows.size == 0:
+            return
+        if os.path.exists(self.del_path) and os.path.getsize(self.del_path):
+            with open(self.del_path, 'rb') as file:
+                data = file.read()
+            if not data.startswith(self.DEL_MAGIC):
+                # Never append row numbers to a file of row ids
+                self._upgrade_tombstones(data)
+        with open(self.del_path, 'ab') as file:
+            if file.tell() == 0:
+                file.write(self.DEL_HEADER.pack(self.DEL_MAGIC))
+            file.write(rows.tobytes())
+
+    def copy_rows(self, base_path: str, rows, append: bool = False, block_rows: int = 65536):
+        """Copy the given rows, in order, into the store files at base_path (created unless `append`)."""
+        target = VectorStore(base_path)
+        if not append or target.dim is None:
+            target.reset(self.dim)
+        with open(target.vec_path, 'ab') as vec_file, open(target.ids_path, 'ab') as ids_file:
+            for start in range(0, len(rows), block_rows):
+                block = rows[start:start + block_rows]
+                vec_file.write(np.ascontiguousarray(self._vectors[block], dtype='<f4').tobytes())
+                ids_file.write(np.ascontiguousarray(self._ids[block]).tobytes())
+
+    def replace_with(self, base_path: str, tombstone_rows=()):
+        """Move the store at base_path over this one, with `tombstone_rows` as its only removed rows."""
+        os.replace(base_path + '.vec', self.vec_path)
+        os.replace(base_path + '.ids', self.ids_path)
+        if os.path.exists(base_path + '.del'):
+            os.remove(base_path + '.del')
+        with open(self.del_path, 'wb'):
+            pass
+        self._open()
+        self.tombstone(tombstone_rows)